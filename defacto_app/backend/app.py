@@ -1,11 +1,35 @@
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import JSONResponse
-from autogen import ConversableAgent, GroupChat, GroupChatManager
-import os
+import asyncio
+from fastapi import FastAPI, File, UploadFile, Form, Header
+from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from autogen import GroupChatManager
 import uuid
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from methods import create_agents, extract_text_from_pdf, parse_agent_names, create_analysis_agents, define_transitions
+from background import BackgroundRegistry
+from batch import BATCH_MAX_FILES, BatchQueue, BatchTooLargeError, spool_uploads
+from cache import completion_cache, content_hash, llm_cache_for, pdf_text_cache
+from documents import DocumentStore, attach_document
+from concurrency import llm_executor, run_blocking
+from feedback import TranscriptDigest, create_feedback_panel, merge_feedback
+from extraction import PdfTooLargeError, check_pdf_size, extract_text, shutdown_pool
+from methods import (
+    create_agents, create_initial_message, create_analysis_agents,
+    define_transitions, restore_group_chat, restore_chat
+)
+from history import attach_history_window, count_tokens, get_stats as get_history_stats
+from llm_client import (
+    get_llm_call_stats, get_llm_config, get_prompt_cache_stats, llm_config_for, llm_session, shared_http_client
+)
+from constants import prompt_preamble
+from prompts import PREFIX_LAYOUT, attach_prompt_layout
+from request_queue import SessionBusyError, SessionRequestQueue
+from retrieval import RETRIEVAL_ENABLED, attach_retrieval, document_context, get_document_index
+from session_store import SnapshotConflictError, create_session_store
+from speaker_selection import SPEAKER_SELECTION, CourtroomSpeakerSelector, get_stats as get_speaker_selection_stats
+from streaming import StreamReplay, attach_message_stream, format_sse, stream_chat
+from transcript import TRANSCRIPT_PAGE_SIZE, Transcript
+from telemetry import METRICS_ENABLED, RequestTimingMiddleware, TimedGroupChat, render_metrics, span
 
 app = FastAPI()
 
@@ -16,198 +40,612 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  
     allow_headers=["*"],  
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(RequestTimingMiddleware)
+
+
+# Utility to estimate the tokens the case takes in each agent call besides the history: the largest
+# excerpts a turn can get in retrieval mode, else the whole document, plus the shared preamble
+def case_prompt_tokens(document):
+    tokens = count_tokens(prompt_preamble) if PREFIX_LAYOUT else 0
+    if RETRIEVAL_ENABLED:
+        return tokens + get_document_index(document.document_id, document.text).excerpt_tokens()
+    return tokens + count_tokens(document.text) + 8
+
+
+# Utility to build the agents and the group chat manager of a simulation
+# `document` is the session's DocumentHandle.
+def build_simulation(role, document, llm_config, stream_tokens=False):
+    # Create agents, streaming their completions token by token if requested
+    agent_llm_config = llm_config
+    if stream_tokens:
+        agent_llm_config = {"config_list": [{**config, "stream": True} for config in llm_config["config_list"]]}
+    agents = create_agents(role, agent_llm_config)
+    llm_agents = [agent for name, agent in agents.items() if name != "human_proxy"]
+    attach_message_stream(llm_agents)
+    # The window budgets the whole call: it leaves room for the case added by the hooks below
+    attach_history_window(llm_agents, reserved=case_prompt_tokens(document))
+    if RETRIEVAL_ENABLED:
+        attach_retrieval(llm_agents, get_document_index(document.document_id, document.text))
+    attach_case_document(llm_agents, document, opening=True)
+
+    # Define transitions
+    disallowed_transitions = define_transitions(agents, role)
+
+    group_chat = TimedGroupChat(
+        agents=list(agents.values()),
+        messages=[],
+        allowed_or_disallowed_speaker_transitions=disallowed_transitions,
+        speaker_transitions_type="disallowed",
+        speaker_selection_method=CourtroomSpeakerSelector(agents, role) if SPEAKER_SELECTION == "rules" else "auto",
+        max_round=4,
+    )
+
+    group_chat_manager = GroupChatManager(
+        groupchat=group_chat,
+        llm_config=llm_config_for(llm_config, "router"),
+        is_termination_msg=lambda x: "TERMINATE" in x.get("content", ""),
+    )
 
+    return agents, group_chat_manager
+
+
+# Utility to lay out the prompts of LLM agents and, in full context mode, give them the case document:
+# as part of the cacheable prompt prefix, or substituted for the references in their messages
+# (and, with prepend, as the first message) in the legacy layout
+def attach_case_document(agents, document, opening, prepend=False):
+    full_document = None if RETRIEVAL_ENABLED else document
+    if PREFIX_LAYOUT:
+        attach_prompt_layout(agents, full_document, opening)
+    elif full_document is not None:
+        attach_document(agents, full_document, prepend)
+
+
+# Utility to give feedback evaluators the case: the passages relevant to each request in retrieval mode,
+# else the whole document. The digest they read leaves the opening message out, so in the legacy layout
+# the document is their first message.
+def attach_feedback_context(evaluators, document):
+    if RETRIEVAL_ENABLED:
+        attach_retrieval(evaluators, get_document_index(document.document_id, document.text))
+    attach_case_document(evaluators, document, opening=True, prepend=True)
+
+
+# Serializable state of a session: enough to rebuild its agents and histories
+def snapshot_session(session):
+    snapshot = {"kind": session["kind"], "document": session["document"]}
+    if session["kind"] == "simulation":
+        snapshot["role"] = session["role"]
+        snapshot["stream_tokens"] = session["stream_tokens"]
+        snapshot["messages"] = session["group_chat_manager"].groupchat.messages
+        if "feedback_evaluators" in session:
+            snapshot["feedback_histories"] = {
+                aspect: session["feedback_humans"][aspect].chat_messages[evaluator]
+                for aspect, evaluator in session["feedback_evaluators"].items()
+            }
+            snapshot["feedback_transcript"] = session["feedback_transcript"].messages
+            snapshot["feedback_turn"] = session.get("feedback_turn", 0)
+    else:
+        snapshot["history"] = session["human_agent"].chat_messages[session["analysis_agent"]]
+        snapshot["transcript"] = session["transcript"].messages
+    return snapshot
+
+
+def restore_session(snapshot):
+    llm_config = get_llm_config()
+    document = documents.acquire(snapshot["document"])
+
+    if snapshot["kind"] == "analysis":
+        session = new_analysis_session(document, llm_config)
+        restore_chat(session["human_agent"], session["analysis_agent"], snapshot["history"])
+        session["transcript"] = Transcript(snapshot.get("transcript", ()))
+        return session
+
+    agents, group_chat_manager = build_simulation(snapshot["role"], document, llm_config, snapshot["stream_tokens"])
+    restore_group_chat(group_chat_manager, snapshot["messages"])
+    session = {
+        "kind": "simulation",
+        "document": snapshot["document"],
+        "document_handle": document,
+        "role": snapshot["role"],
+        "stream_tokens": snapshot["stream_tokens"],
+        "group_chat_manager": group_chat_manager,
+        "agents": agents,
+        "user_role": "defense attorney" if snapshot["role"] == "DA" else "prosecuting attorney",
+        "transcript": Transcript(),
+    }
+    session["digest"] = TranscriptDigest(session["user_role"])
+    sync_transcript(session)
+    if "feedback_transcript" in snapshot:
+        session["feedback_transcript"] = Transcript(snapshot["feedback_transcript"])
+    if "feedback_histories" in snapshot:
+        evaluators, humans = create_feedback_panel(llm_config, list(snapshot["feedback_histories"]))
+        attach_feedback_context(list(evaluators.values()), document)
+        for aspect, history in snapshot["feedback_histories"].items():
+            restore_chat(humans[aspect], evaluators[aspect], history)
+        session["feedback_evaluators"] = evaluators
+        session["feedback_humans"] = humans
+        session["feedback_turn"] = snapshot["feedback_turn"]
+    return session
+
+
+# Live sessions are kept in memory and snapshotted to the configured backend,
+# so evicted or restarted sessions are rebuilt on demand
+sessions = create_session_store(snapshot_session, restore_session)
+
+# One copy of each case document, shared by the sessions using it
+documents = DocumentStore(load=lambda document_id: pdf_text_cache.get(document_id) or sessions.get_document(document_id))
+
+# Simulations whose initialization is still running in the background, by session id
+initializations = BackgroundRegistry(records=sessions)
 
-# To hold session data for simplicity
-sessions = {}
+# Requests waiting for or running on each session's agents
+session_requests = SessionRequestQueue()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    initializations.shutdown()
+    batch_jobs.shutdown()
+    shutdown_pool()
+    llm_executor.shutdown(wait=False, cancel_futures=True)
+    shared_http_client.close()
 
 
 class ContinueConversationRequest(BaseModel):
     session_id: str
     user_message: str
+    # Sequence number of the last transcript message the client has; the response starts after it
+    cursor: Optional[int] = None
+
+
+# Utility to run an endpoint's agent conversation off the event loop, with its completion cache, and time it.
+# Its LLM calls count against the session's concurrency limit.
+async def run_chat(endpoint, session_id, func, *args, **kwargs):
+    with llm_session(session_id), span("initiate_chat", endpoint):
+        return await run_blocking(func, *args, cache=llm_cache_for(endpoint), **kwargs)
+
+
+# Utility to run a request's work after the earlier requests of its session and answer with the work's
+# response. An identical request (same key) already waiting or running gets that request's response.
+# The session stays live while the work runs.
+async def run_in_session(session_id, key, work):
+    async def run():
+        with sessions.in_use(session_id):
+            return await work()
+
+    try:
+        task, _ = session_requests.submit(session_id, key, run)
+    except SessionBusyError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
+    try:
+        return await asyncio.shield(task)
+    except SnapshotConflictError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=409)
+
+
+# Utility to answer with the transcript messages after the client's cursor or, when the client sent none,
+# after `start`; also returns the new cursor
+def transcript_response(transcript, cursor, start):
+    return {"response": transcript.since(start if cursor is None else cursor), "cursor": transcript.cursor}
+
+
+# Utility to answer GET .../transcript/{session_id}: a page of messages, or 304 if the client has it already
+def transcript_page(transcript, cursor, limit, if_none_match):
+    page, etag = transcript.page(cursor, limit)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=page, headers=headers)
+
+
+# Utility to bring a simulation's transcript, and the digest feedback is given on, up to date with its group chat
+def sync_transcript(session):
+    session["transcript"].sync(session["group_chat_manager"].groupchat.messages)
+    session["digest"].update(session["transcript"])
+
+
+# Utility to ask all feedback evaluators of a session at once and merge their replies.
+# Evaluators that fail are left out, unless they all do.
+async def review_feedback(session_id, evaluators, humans, message):
+    results = await asyncio.gather(
+        *(
+            run_chat(
+                "simulation_feedback",
+                session_id,
+                humans[aspect].initiate_chat,
+                recipient=evaluator,
+                message=message,
+                clear_history=False,
+            )
+            for aspect, evaluator in evaluators.items()
+        ),
+        return_exceptions=True,
+    )
+    replies = [(aspect, result.summary) for aspect, result in zip(evaluators, results) if not isinstance(result, BaseException)]
+    if not replies:
+        raise results[0]
+    return merge_feedback(replies)
 
-@app.post("/simulation/initialize")
-async def initialize_conversation(pdf: UploadFile = File(...), role: str = Form(...)):
-    if role not in ["DA", "PA"]:
-        return JSONResponse(content={"error": "Invalid role. Use 'DA' or 'PA'."}, status_code=400)
-    
+
+# Utility to build the agents of a new simulation session. Returns (session, initial_message).
+def new_simulation_session(role, document, llm_config, stream_tokens=False):
     if role == "DA":
         human_proxy_role = "defense attorney"
     else:
         human_proxy_role = "prosecuting attorney"
 
+    agents, group_chat_manager = build_simulation(role, document, llm_config, stream_tokens)
+    session = {
+        "kind": "simulation",
+        "document": document.document_id,
+        "document_handle": document,
+        "role": role,
+        "stream_tokens": stream_tokens,
+        "group_chat_manager": group_chat_manager,
+        "agents": agents,
+        "user_role": human_proxy_role,
+        "transcript": Transcript(),
+        "digest": TranscriptDigest(human_proxy_role),
+    }
+    context = document_context(document.document_id, inline=not PREFIX_LAYOUT)
+    return session, create_initial_message(human_proxy_role, context)
+
+
+# Utility to validate the upload, build the agents and register a new simulation session.
+# Returns (session_id, initial_message), or a JSONResponse describing the error.
+async def start_simulation(pdf, role, stream_tokens=False):
+    if role not in ["DA", "PA"]:
+        return JSONResponse(content={"error": "Invalid role. Use 'DA' or 'PA'."}, status_code=400)
+
     # Extract text from the uploaded PDF
-    pdf_text = extract_text_from_pdf(pdf.file)
+    pdf_bytes = await pdf.read()
+    try:
+        pdf_text = await extract_text(pdf_bytes)
+    except PdfTooLargeError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
 
     # Check API key
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    llm_config = get_llm_config()
+    if not llm_config:
         return JSONResponse(content={"error": "OpenAI API key not configured."}, status_code=500)
 
-    llm_config = {"config_list": [{"model": "gpt-4o-mini", "api_key": api_key}]}
+    document_id = content_hash(pdf_bytes)
+    sessions.put_document(document_id, pdf_text)
+    session, initial_message = new_simulation_session(role, documents.acquire(document_id, pdf_text), llm_config, stream_tokens)
 
-    # Create agents
-    agents = create_agents(role, pdf_text, llm_config)
+    # Initialize session
+    session_id = str(uuid.uuid4())
+    sessions[session_id] = session
+
+    return session_id, initial_message
+
+
+# Background initialization: extracts the document and runs the opening rounds, recording each message
+# as it is spoken, then registers the session
+async def initialize_in_background(work, session_id, role, pdf_bytes, llm_config):
+    work.status = "extracting"
+    pdf_text = await extract_text(pdf_bytes)
+
+    work.status = "opening"
+    document_id = content_hash(pdf_bytes)
+    sessions.put_document(document_id, pdf_text)
+    session, initial_message = new_simulation_session(role, documents.acquire(document_id, pdf_text), llm_config)
+    with llm_session(session_id), span("initiate_chat", "simulation_initialize"):
+        async for event, data in stream_chat(
+            session["agents"]["human_proxy"].initiate_chat,
+            session["group_chat_manager"],
+            message=initial_message,
+            summary_method="reflection_with_llm",
+            cache=llm_cache_for("simulation_initialize"),
+        ):
+            if event == "message":
+                work.messages.append(data)
+            elif event == "result":
+                sync_transcript(session)
+
+    sessions[session_id] = session
+
+
+# Utility to build the agents of a new analysis session for a DocumentHandle
+def new_analysis_session(document, llm_config):
+    agents = create_analysis_agents(document_context(document.document_id, inline=False), llm_config)
+    analysis_agent = agents["legal_analysis_agent"]
+    if RETRIEVAL_ENABLED:
+        attach_retrieval([analysis_agent], get_document_index(document.document_id, document.text))
+    attach_case_document([analysis_agent], document, opening=False, prepend=True)
+    return {
+        "kind": "analysis",
+        "document": document.document_id,
+        "document_handle": document,
+        "human_agent": agents["human_agent"],
+        "analysis_agent": analysis_agent,
+        "transcript": Transcript(),
+    }
 
-    # Define transitions
-    disallowed_transitions = define_transitions(agents, role)
 
-    group_chat = GroupChat(
-        agents=agents.values(),
-        messages=[],
-        allowed_or_disallowed_speaker_transitions=disallowed_transitions,
-        speaker_transitions_type="disallowed",
-        max_round=4,
-    )
+# Utility to summarize a case document with a new analysis agent and register the analysis session.
+# Returns (session_id, session).
+async def start_analysis(document_id, pdf_text, llm_config):
+    sessions.put_document(document_id, pdf_text)
+    session = new_analysis_session(documents.acquire(document_id, pdf_text), llm_config)
+    session_id = str(uuid.uuid4())
 
-    group_chat_manager = GroupChatManager(
-        groupchat=group_chat,
-        llm_config=llm_config,
-        is_termination_msg=lambda x: "TERMINATE" in x.get("content", ""),
+    chat_result = await run_chat(
+        "analysis_initialize",
+        session_id,
+        session["human_agent"].initiate_chat,
+        recipient=session["analysis_agent"],
+        message="First, summarize the pdf that I uploaded.",
     )
+    session["transcript"].extend(chat_result.chat_history)
 
     # Initialize session
-    session_id = str(uuid.uuid4())
-    sessions[session_id] = {
-        "group_chat_manager": group_chat_manager,
-        "agents": agents,
-    }
+    sessions[session_id] = session
+    return session_id, session
 
-    initial_message = f"""
-    I will be roleplaying as the {human_proxy_role} in this mock trial. We will begin with the direct examination, where the defendant is already on the stand, and I, as the {human_proxy_role}, will be starting the questioning. However, this simulation will cover the entire court proceeding, including cross-examinations, objections, and any other trial phases.
 
-    The prosecuting attorney should only speak after the judge has directly given them the floor, and the defense attorney should only speak after the prosecuting attorney has finished their questioning. The witnesses should only speak when directly addressed by the attorneys.
+# Batch job worker: extracts and summarizes one spooled document into a new analysis session. The PDF is
+# read from its file only for the extraction.
+async def analyze_batch_document(document, progress):
+    progress("extracting")
+    pdf_text = await extract_text(await asyncio.to_thread(document.read))
+    llm_config = get_llm_config()
+    if not llm_config:
+        raise RuntimeError("OpenAI API key not configured.")
 
-    When an attorney says they are finished with questioning, the next speaker should always be the judge. The judge will then decide who has the floor next based on the courtroom procedure.
+    progress("analyzing")
+    session_id, session = await start_analysis(document.document_id, pdf_text, llm_config)
+    return {"session_id": session_id, **transcript_response(session["transcript"], None, 1)}
 
-    For context, the following document contains all the necessary details about the case, including background information, procedural context, and evidence:
 
-    <context> {pdf_text} </context>
+batch_jobs = BatchQueue(analyze_batch_document)
 
-    Please ensure that all responses are appropriate for a courtroom setting, align with the role you are assigned, and adhere to the rules of courtroom procedure.
-    """
 
-    chat_result = agents["human_proxy"].initiate_chat(
-        group_chat_manager,
-        message=initial_message,
-        summary_method="reflection_with_llm",
-    )
+# Utility to serve an agent conversation as server-sent events, storing the resulting history in the session
+async def stream_simulation_events(session_id, session, first_events, endpoint, func, *args, **kwargs):
+    for event, data in first_events:
+        yield format_sse(event, data)
+    try:
+        with sessions.in_use(session_id), llm_session(session_id), span("initiate_chat", endpoint):
+            async for event, data in stream_chat(func, *args, cache=llm_cache_for(endpoint), **kwargs):
+                if event == "result":
+                    sync_transcript(session)
+                    sessions.save(session_id, session)
+                else:
+                    yield format_sse(event, data)
+    except Exception as e:
+        yield format_sse("error", {"error": str(e)})
+        return
+    yield format_sse("done", {"cursor": session["transcript"].cursor})
+
 
+@app.post("/simulation/initialize")
+async def initialize_conversation(pdf: UploadFile = File(...), role: str = Form(...)):
+    started = await start_simulation(pdf, role)
+    if isinstance(started, JSONResponse):
+        return started
+    session_id, initial_message = started
     session = sessions[session_id]
-    session["conversation_history"] = chat_result.chat_history
-    session["user_role"] = human_proxy_role
 
-    parsed_history = parse_agent_names(chat_result.chat_history[1:])
+    with sessions.in_use(session_id):
+        await run_chat(
+            "simulation_initialize",
+            session_id,
+            session["agents"]["human_proxy"].initiate_chat,
+            session["group_chat_manager"],
+            message=initial_message,
+            summary_method="reflection_with_llm",
+        )
+
+        sync_transcript(session)
+        sessions.save(session_id, session)
+
+    return {"session_id": session_id, **transcript_response(session["transcript"], None, 1)}
+
+@app.post("/simulation/background/initialize")
+async def background_initialize_conversation(pdf: UploadFile = File(...), role: str = Form(...)):
+    if role not in ["DA", "PA"]:
+        return JSONResponse(content={"error": "Invalid role. Use 'DA' or 'PA'."}, status_code=400)
+
+    pdf_bytes = await pdf.read()
+    try:
+        check_pdf_size(pdf_bytes)
+    except PdfTooLargeError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+
+    # Check API key
+    llm_config = get_llm_config()
+    if not llm_config:
+        return JSONResponse(content={"error": "OpenAI API key not configured."}, status_code=500)
+
+    session_id = str(uuid.uuid4())
+    work = initializations.start(session_id, initialize_in_background, session_id, role, pdf_bytes, llm_config)
+    return JSONResponse(content={"session_id": session_id, "status": work.status}, status_code=202)
 
-    return {"session_id": session_id, "response": parsed_history}
+@app.get("/simulation/status/{session_id}")
+async def simulation_status(session_id: str):
+    work = initializations.get(session_id)
+    if work:
+        return {"session_id": session_id, **work.to_dict()}
+
+    session = sessions.get(session_id)
+    if not session or session["kind"] != "simulation":
+        return JSONResponse(content={"error": "Session not found."}, status_code=404)
+    transcript = session["transcript"]
+    return {"session_id": session_id, "status": "ready", "response": transcript.since(1), "cursor": transcript.cursor}
+
+@app.get("/simulation/transcript/{session_id}")
+async def get_simulation_transcript(
+    session_id: str, cursor: int = 0, limit: int = TRANSCRIPT_PAGE_SIZE, feedback: bool = False,
+    if_none_match: Optional[str] = Header(None),
+):
+    session = sessions.get(session_id)
+    if not session or session["kind"] != "simulation":
+        return JSONResponse(content={"error": "Session not found."}, status_code=404)
+    transcript = session.get("feedback_transcript", Transcript()) if feedback else session["transcript"]
+    return transcript_page(transcript, cursor, limit, if_none_match)
 
 @app.post("/simulation/continue")
 async def continue_conversation(request: ContinueConversationRequest):
-    session = sessions.get(request.session_id)
-    if not session:
+    failed = await initializations.wait(request.session_id)
+    if failed:
+        return JSONResponse(content={"error": f"Session initialization failed: {failed.error}"}, status_code=500)
+    if request.session_id not in sessions:
         return JSONResponse(content={"error": "Session not found."}, status_code=404)
 
-    group_chat_manager = session["group_chat_manager"]
-    agents = session["agents"]
-
-    chat_result = agents["human_proxy"].initiate_chat(
-        group_chat_manager,
-        message=request.user_message,
-        clear_history=False,
-    )
+    async def respond():
+        # Looked up once the earlier requests are done, so it is the session as they left it
+        session = sessions.get(request.session_id)
+        if not session:
+            return JSONResponse(content={"error": "Session not found."}, status_code=404)
+        group_chat_manager = session["group_chat_manager"]
+        agents = session["agents"]
+        transcript = session["transcript"]
+        start = transcript.cursor
+
+        await run_chat(
+            "simulation_continue",
+            request.session_id,
+            agents["human_proxy"].initiate_chat,
+            group_chat_manager,
+            message=request.user_message,
+            clear_history=False,
+        )
     
-    session["conversation_history"] = chat_result.chat_history
+        sync_transcript(session)
+        sessions.save(request.session_id, session)
 
+        # The messages after the user's own
+        return transcript_response(transcript, request.cursor, start + 1)
 
-    # parse response for most recent message
-    index_of_next_message = 0
-    for i in range(len(chat_result.chat_history) - 1, -1, -1):
-        response = chat_result.chat_history[i]
-        if response['role'] == 'assistant':
-            index_of_next_message = i + 1
-            break
-    
-    parsed_history = parse_agent_names(chat_result.chat_history[index_of_next_message:])
-    return {"response": parsed_history}
+    return await run_in_session(request.session_id, ("simulation_continue", request.user_message), respond)
+
+
+@app.post("/simulation/stream/initialize")
+async def stream_initialize_conversation(pdf: UploadFile = File(...), role: str = Form(...)):
+    started = await start_simulation(pdf, role, stream_tokens=True)
+    if isinstance(started, JSONResponse):
+        return started
+    session_id, initial_message = started
+    session = sessions[session_id]
+
+    events = StreamReplay()
+
+    def respond():
+        return events.feed(stream_simulation_events(
+            session_id,
+            session,
+            [("session", {"session_id": session_id})],
+            "simulation_initialize",
+            session["agents"]["human_proxy"].initiate_chat,
+            session["group_chat_manager"],
+            message=initial_message,
+            summary_method="reflection_with_llm",
+        ))
+
+    # The opening rounds are the session's first request, queued before the client learns the session id,
+    # so the requests it sends during the stream wait for them
+    session_requests.submit(session_id, ("simulation_stream_initialize",), respond, events)
+    return StreamingResponse(events.replay(), media_type="text/event-stream")
+
+@app.post("/simulation/stream/continue")
+async def stream_continue_conversation(request: ContinueConversationRequest):
+    failed = await initializations.wait(request.session_id)
+    if failed:
+        return JSONResponse(content={"error": f"Session initialization failed: {failed.error}"}, status_code=500)
+    if request.session_id not in sessions:
+        return JSONResponse(content={"error": "Session not found."}, status_code=404)
+
+    events = StreamReplay()
+
+    # Looked up once the earlier requests are done, so it is the session as they left it
+    async def session_events():
+        session = sessions.get(request.session_id)
+        if not session:
+            yield format_sse("error", {"error": "Session not found."})
+            return
+        async for event in stream_simulation_events(
+            request.session_id,
+            session,
+            [],
+            "simulation_continue",
+            session["agents"]["human_proxy"].initiate_chat,
+            session["group_chat_manager"],
+            message=request.user_message,
+            clear_history=False,
+        ):
+            yield event
+
+    def respond():
+        return events.feed(session_events())
+
+    # An identical request already waiting or running is followed instead
+    try:
+        _, events = session_requests.submit(
+            request.session_id, ("simulation_stream_continue", request.user_message), respond, events
+        )
+    except SessionBusyError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
+    return StreamingResponse(events.replay(), media_type="text/event-stream")
 
 
 @app.post("/analysis/initialize")
 async def initialize_analysis(pdf: UploadFile = File(...)):
 
     # Extract text from the uploaded PDF
-    pdf_text = extract_text_from_pdf(pdf.file)
+    pdf_bytes = await pdf.read()
+    try:
+        pdf_text = await extract_text(pdf_bytes)
+    except PdfTooLargeError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
 
     # Check API key
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    llm_config = get_llm_config()
+    if not llm_config:
         return JSONResponse(content={"error": "OpenAI API key not configured."}, status_code=500)
 
-    llm_config = {"config_list": [{"model": "gpt-4o-mini", "api_key": api_key}]}
-
-    analysis_agent = ConversableAgent(
-        name="legal_analysis_agent", 
-        system_message=f"""
-         You are LegalAnalysisAgent, an AI expert in analyzing legal court proceedings and legal notes and information. 
-         This is the information you will be analyzing: <context> {pdf_text} </context> 
-         Your primary role is to explain the legal information in the document and answer all of the user's questions to the best of your ability. 
-         Your goal is to help the user gain a deeper understanding of the legal aspects of the court transcript. 
-         You can also answer questions related to legal concepts, procedures, and strategies. 
-         You have access to a wide range of legal knowledge and can provide detailed explanations on legal topics. 
-         You should provide accurate, informative, and insightful responses to the user's questions. 
-         Please don't respond in markdown, but respond in paragraph format and use newlines when necessary. Be as concise as possible with your answers.
-        """,
-        llm_config=llm_config, 
-    )
+    session_id, session = await start_analysis(content_hash(pdf_bytes), pdf_text, llm_config)
 
-    human_agent = ConversableAgent(
-        "human_agent",
-        llm_config=False,
-        human_input_mode="NEVER",
-        code_execution_config=False,
-        is_termination_msg=lambda message: True,
-        description="""
-        Human user asking questions to the feedback agent.
-        """
-    )
-
-    chat_result = human_agent.initiate_chat(
-        recipient=analysis_agent,
-        message="First, summarize the pdf that I uploaded."
-    )
-
-    # Initialize session
-    session_id = str(uuid.uuid4())
-    sessions[session_id] = {
-        "human_agent": human_agent,
-        "analysis_agent": analysis_agent,
-    }
-    # print(chat_result)
+    return {"session_id": session_id, **transcript_response(session["transcript"], None, 1)}
 
-    return {"session_id": session_id, "response": parse_agent_names(chat_result.chat_history)[1:]}
+@app.get("/analysis/transcript/{session_id}")
+async def get_analysis_transcript(
+    session_id: str, cursor: int = 0, limit: int = TRANSCRIPT_PAGE_SIZE, if_none_match: Optional[str] = Header(None)
+):
+    session = sessions.get(session_id)
+    if not session or session["kind"] != "analysis":
+        return JSONResponse(content={"error": "Session not found."}, status_code=404)
+    return transcript_page(session["transcript"], cursor, limit, if_none_match)
 
 @app.post("/analysis/continue")
 async def continue_conversation(request: ContinueConversationRequest):
-    session = sessions.get(request.session_id)
-    if not session:
+    if request.session_id not in sessions:
         return JSONResponse(content={"error": "Session not found."}, status_code=404)
 
-    analysis_agent = session['analysis_agent']
-    human_agent = session['human_agent']
-    
-    chat_result = human_agent.initiate_chat(
-        recipient=analysis_agent,
-        message = request.user_message
-    )
+    async def respond():
+        session = sessions.get(request.session_id)
+        if not session:
+            return JSONResponse(content={"error": "Session not found."}, status_code=404)
+        analysis_agent = session['analysis_agent']
+        human_agent = session['human_agent']
+        transcript = session["transcript"]
+        start = transcript.cursor
+
+        chat_result = await run_chat(
+            "analysis_continue",
+            request.session_id,
+            human_agent.initiate_chat,
+            recipient=analysis_agent,
+            message = request.user_message,
+        )
+        # Each question starts a new chat, so the history holds just this exchange
+        transcript.extend(chat_result.chat_history)
+        sessions.save(request.session_id, session)
+
+        return transcript_response(transcript, request.cursor, start + 1)
 
-    # parse response for most recent message
-    # index_of_next_message = 0
-    # for i in range(len(chat_result.chat_history) - 1, -1, -1):
-    #     response = chat_result.chat_history[i]
-    #     if response['role'] == 'assistant':
-    #         index_of_next_message = i + 1
-    #         break
-    return {"response": parse_agent_names(chat_result.chat_history)[1:]}
+    return await run_in_session(request.session_id, ("analysis_continue", request.user_message), respond)
 
 
 
@@ -215,79 +653,108 @@ async def continue_conversation(request: ContinueConversationRequest):
 
 @app.post("/simulation/feedback")
 async def handle_feedback(request: ContinueConversationRequest):
-    session = sessions.get(request.session_id)
-    if not session:
+    failed = await initializations.wait(request.session_id)
+    if failed:
+        return JSONResponse(content={"error": f"Session initialization failed: {failed.error}"}, status_code=500)
+    if request.session_id not in sessions:
         return JSONResponse(content={"error": "Session not found."}, status_code=404)
     
-    human_proxy_role = session["user_role"]
+    async def respond():
+        session = sessions.get(request.session_id)
+        if not session:
+            return JSONResponse(content={"error": "Session not found."}, status_code=404)
+        human_proxy_role = session["user_role"]
+        digest = session["digest"]
+
+        # Check if feedback evaluators are already initialized
+        if "feedback_evaluators" in session:
+            # Continue feedback with the turns since the last feedback
+            evaluators = session["feedback_evaluators"]
+            humans = session["feedback_humans"]
+            new_turns = digest.text(session.get("feedback_turn", 0))
+            message = f"{request.user_message} I am the {human_proxy_role}. Here are the new messages since the last feedback: {new_turns}"
+        else:
+            # Initialize feedback evaluators. Their first message is the same, so in the prefix layout
+            # it is part of the prompt prefix they share, after the case document.
+            evaluators, humans = create_feedback_panel(get_llm_config())
+            attach_feedback_context(list(evaluators.values()), session["document_handle"])
+            message = f"""{request.user_message} I am the {human_proxy_role}. Here is the entire conversation history: {digest.text()}"""
+
+        reply = await review_feedback(request.session_id, evaluators, humans, message)
+
+        # Store feedback evaluators and the exchange
+        session["feedback_evaluators"] = evaluators
+        session["feedback_humans"] = humans
+        session["feedback_turn"] = len(digest.turns)
+        transcript = session["feedback_transcript"] = session.get("feedback_transcript") or Transcript()
+        start = transcript.cursor
+        transcript.append({"content": request.user_message, "role": "assistant", "name": None})
+        transcript.append({"content": reply, "role": "user", "name": "feedback_agent"})
+        sessions.save(request.session_id, session)
+
+        return transcript_response(transcript, request.cursor, start + 1)
+
+    return await run_in_session(request.session_id, ("simulation_feedback", request.user_message), respond)
+
+
+### Batch APIs
+
+@app.post("/analysis/batch")
+async def submit_analysis_batch(pdfs: List[UploadFile] = File(...)):
+    if len(pdfs) > BATCH_MAX_FILES:
+        return JSONResponse(content={"error": f"At most {BATCH_MAX_FILES} PDFs per batch."}, status_code=400)
 
-    # Check if feedback agents are already initialized
-    if "feedback_agent" in session and "human_agent" in session:
-        # Continue feedback logic
-        feedback_agent = session['feedback_agent']
-        human_agent = session['human_agent']
-        group_chat_manager = session["group_chat_manager"]
-        
-        last_feedback_index = session.get('last_feedback_index', 0)
-        conversation_history = session["conversation_history"]
-        new_messages = conversation_history[last_feedback_index:]
-        convo_string = group_chat_manager.messages_to_string(new_messages)
-
-        chat_result = human_agent.initiate_chat(
-            recipient=feedback_agent,
-            message=f"{request.user_message} I am the {human_proxy_role}. Here are the new messages since the last feedback: {convo_string}",
-            clear_history=False,
-        )
-
-        # Update feedback history
-        # session['feedback_history'] = chat_result.chat_history
-
-        # Find latest response index
-        index_of_next_message = 0
-        for i in range(len(chat_result.chat_history) - 1, -1, -1):
-            response = chat_result.chat_history[i]
-            if response['role'] == 'assistant':
-                index_of_next_message = i + 1
-                break
-
-        return {"response": parse_agent_names(chat_result.chat_history[index_of_next_message:])}
-
-    else:
-        # Initialize feedback agents
-        group_chat_manager = session["group_chat_manager"]
-        conversation_history = session["conversation_history"]
-        # print(f'conversation history {conversation_history}')
-        convo_string = group_chat_manager.messages_to_string(conversation_history)
-        # print(f'convo string {convo_string}')
-
-        feedback_agent = ConversableAgent(
-            name="feedback_agent", 
-            system_message=f"""
-            You are a legal feedback assistant for a mock trial simulation.
-            Cite specific examples from the user's performance and provide constructive feedback on their courtroom performance, legal arguments, and trial strategy.
-            Answer in paragraph format and be as concise as possible.
-            """,
-            llm_config=session["group_chat_manager"].llm_config,
-        )
+    # Check API key
+    if not get_llm_config():
+        return JSONResponse(content={"error": "OpenAI API key not configured."}, status_code=500)
 
-        human_agent = ConversableAgent(
-            "human_agent",
-            llm_config=False,
-            human_input_mode="NEVER",
-            is_termination_msg=lambda message: True,
-        )
+    try:
+        documents = await spool_uploads(pdfs)
+    except (PdfTooLargeError, BatchTooLargeError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    job = batch_jobs.submit(documents)
+    return JSONResponse(content=job.to_dict(), status_code=202)
+
+@app.get("/analysis/batch/{job_id}")
+async def get_analysis_batch(job_id: str):
+    job = batch_jobs.get(job_id)
+    if not job:
+        return JSONResponse(content={"error": "Job not found."}, status_code=404)
+    return job.to_dict()
+
+@app.get("/analysis/batch/{job_id}/stream")
+async def stream_analysis_batch(job_id: str):
+    job = batch_jobs.get(job_id)
+    if not job:
+        return JSONResponse(content={"error": "Job not found."}, status_code=404)
+
+    async def events():
+        async for event, data in job.events():
+            yield format_sse(event, data)
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+### Cache APIs
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "pdf_text": pdf_text_cache.get_stats(),
+        "completions": completion_cache.get_stats(),
+        "sessions": sessions.get_stats(),
+        "documents": documents.get_stats(),
+        "history": get_history_stats(),
+        "prompt_cache": get_prompt_cache_stats(),
+        "llm_calls": get_llm_call_stats(),
+        "speaker_selection": get_speaker_selection_stats(),
+        "session_requests": session_requests.get_stats(),
+    }
 
-        feedback_result = human_agent.initiate_chat(
-            recipient=feedback_agent,
-            clear_history=False,
-            message=f"""{request.user_message} I am the {human_proxy_role}. Here is the entire conversation history: {convo_string}""",
-        )
 
-        # Store feedback agents and history
-        session['feedback_agent'] = feedback_agent
-        session['human_agent'] = human_agent
-        session['last_feedback_index'] = len(conversation_history)
-        # session['feedback_history'] = feedback_result.chat_history
+### Metrics APIs
 
-        parsed_feedback = parse_agent_names(feedback_result.chat_history[1:])
-        return {"response": parsed_feedback}
+@app.get("/metrics")
+async def metrics():
+    if not METRICS_ENABLED:
+        return JSONResponse(content={"error": "Metrics are disabled."}, status_code=404)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
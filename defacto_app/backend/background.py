@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+
+
+# Seconds a failed piece of work stays visible
+FAILED_TTL = int(os.getenv("DEFACTO_BACKGROUND_FAILED_TTL", "3600"))
+# Seconds without a status change after which work running in another worker is taken as lost
+STALE_TTL = int(os.getenv("DEFACTO_BACKGROUND_STALE_TTL", "600"))
+# Seconds between checks of work running in another worker
+POLL_INTERVAL = 0.5
+
+
+# Progress of work a request started but did not wait for: its status, the messages produced so far
+# and, if it failed, the error. Status changes are published to the registry's shared records.
+class BackgroundWork:
+    def __init__(self, key, publish=None, status="queued"):
+        self.key = key
+        self._status = status
+        self._publish = publish
+        self.messages = []
+        self.error = None
+        self.finished = None
+        self.task = None
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        self._status = status
+        if self._publish is not None:
+            self._publish(self)
+
+    def to_dict(self):
+        result = {"status": self.status, "response": list(self.messages)}
+        if self.error is not None:
+            result["error"] = self.error
+        return result
+
+
+# Tracks background work by key (e.g. session id). Work is forgotten as soon as it succeeds, since its
+# result is stored elsewhere; failures are kept for failed_ttl seconds so clients can see what went wrong.
+# With `records` (an object with put_status, get_status and delete_status, e.g. the session store), the
+# status of the work is also kept there, so other workers sharing it see the work and wait for it.
+class BackgroundRegistry:
+    def __init__(self, failed_ttl=FAILED_TTL, records=None, stale_ttl=STALE_TTL):
+        self.failed_ttl = failed_ttl
+        self.records = records
+        self.stale_ttl = stale_ttl
+        self._work = {}
+
+    def _expire(self):
+        now = time.time()
+        for key, work in list(self._work.items()):
+            if work.finished and now - work.finished > self.failed_ttl:
+                del self._work[key]
+
+    def _publish(self, work):
+        if self.records is not None:
+            self.records.put_status(work.key, {"status": work.status, "error": work.error, "updated_at": time.time()})
+
+    # Utility to run `func(work, *args)` in the background under `key`; returns the BackgroundWork
+    def start(self, key, func, *args):
+        self._expire()
+        work = self._work[key] = BackgroundWork(key, self._publish)
+        self._publish(work)
+
+        async def run():
+            try:
+                await func(work, *args)
+            except Exception as e:
+                work.error = str(e) or type(e).__name__
+                work.finished = time.time()
+                work.status = "failed"
+            else:
+                del self._work[key]
+                if self.records is not None:
+                    self.records.delete_status(key)
+
+        work.task = asyncio.create_task(run())
+        return work
+
+    # Work under `key` running or failed in another worker, rebuilt from its shared record
+    def _remote(self, key):
+        record = self.records.get_status(key) if self.records is not None else None
+        if record is None:
+            return None
+        age = time.time() - record["updated_at"]
+        if record["status"] == "failed":
+            if age > self.failed_ttl:
+                return None
+        elif age > self.stale_ttl:
+            record = {"status": "failed", "error": "Initialization was interrupted."}
+        work = BackgroundWork(key, status=record["status"])
+        work.error = record.get("error")
+        return work
+
+    def get(self, key):
+        return self._work.get(key) or self._remote(key)
+
+    # Waits for the work under `key`, if any is running; returns it if it failed, else None
+    async def wait(self, key):
+        work = self._work.get(key)
+        if work is not None:
+            await asyncio.shield(work.task)
+            return work if work.error is not None else None
+
+        # Running in another worker: follow its record until it is gone (done) or failed
+        while True:
+            work = self._remote(key)
+            if work is None or work.status == "failed":
+                return work
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def shutdown(self):
+        for work in list(self._work.values()):
+            work.task.cancel()
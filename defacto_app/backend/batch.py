@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+
+from extraction import MAX_PDF_BYTES, PdfTooLargeError
+
+
+# Documents of all batch jobs processed at once
+BATCH_CONCURRENCY = int(os.getenv("DEFACTO_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("DEFACTO_BATCH_MAX_FILES", "200"))
+# Size of all the PDFs of one job together
+BATCH_MAX_BYTES = int(os.getenv("DEFACTO_BATCH_MAX_MB", "500")) * 1024 * 1024
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# Seconds a finished job's results stay available
+BATCH_JOB_TTL = int(os.getenv("DEFACTO_BATCH_JOB_TTL", str(24 * 3600)))
+
+FINAL_STATUSES = ("done", "failed")
+
+
+class BatchTooLargeError(ValueError):
+    pass
+
+
+# A document of a batch job, kept in a temporary file until it is processed so that queued jobs hold
+# no PDF bytes in memory. document_id is its content hash (as cache.content_hash).
+class SpooledDocument:
+    def __init__(self, filename):
+        self.filename = filename
+        self.size = 0
+        self.document_id = None
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(prefix="defacto-batch-", suffix=".pdf", delete=False)
+        self.path = self._file.name
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        self._file.close()
+        self.document_id = self._hash.hexdigest()
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def remove(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# Utility to spool uploads (objects with an async read(size), e.g. FastAPI's UploadFile) to temporary files.
+# Raises PdfTooLargeError for a PDF over the extraction limit and BatchTooLargeError past max_bytes in all,
+# having removed the files spooled so far.
+async def spool_uploads(uploads, max_bytes=BATCH_MAX_BYTES):
+    documents = []
+    total = 0
+    try:
+        for upload in uploads:
+            document = SpooledDocument(upload.filename)
+            documents.append(document)
+            while chunk := await upload.read(SPOOL_CHUNK_BYTES):
+                document.write(chunk)
+                total += len(chunk)
+                if document.size > MAX_PDF_BYTES:
+                    raise PdfTooLargeError(
+                        f"{upload.filename}: PDF is larger than {MAX_PDF_BYTES // (1024 * 1024)} MB."
+                    )
+                if total > max_bytes:
+                    raise BatchTooLargeError(f"The PDFs of a batch may take at most {max_bytes // (1024 * 1024)} MB.")
+            document.close()
+    except BaseException:
+        for document in documents:
+            document.remove()
+        raise
+    return documents
+
+
+# Progress and results of one batch of documents. Each document goes queued -> extracting -> analyzing -> done or failed.
+class BatchJob:
+    def __init__(self, job_id, filenames):
+        self.job_id = job_id
+        self.created = time.time()
+        self.finished = None
+        self.documents = [{"index": i, "filename": name, "status": "queued"} for i, name in enumerate(filenames)]
+        self._listeners = set()
+
+    def _publish(self, event, data):
+        for queue in self._listeners:
+            queue.put_nowait((event, data))
+
+    def update(self, index, **changes):
+        document = self.documents[index]
+        if document["status"] in FINAL_STATUSES:
+            return
+        document.update(changes)
+        self._publish("document", dict(document))
+
+    def finish(self):
+        self.finished = time.time()
+        self._publish("done", self.summary())
+
+    def summary(self):
+        counts = {}
+        for document in self.documents:
+            counts[document["status"]] = counts.get(document["status"], 0) + 1
+        return {"job_id": self.job_id, "status": "done" if self.finished else "running", "counts": counts}
+
+    def to_dict(self):
+        return {**self.summary(), "documents": self.documents}
+
+    # Yields ("document", <document>) for the current state of every document, then for each update,
+    # and finally ("done", <summary>)
+    async def events(self):
+        queue = asyncio.Queue()
+        self._listeners.add(queue)
+        try:
+            for document in self.documents:
+                yield "document", dict(document)
+            if self.finished:
+                yield "done", self.summary()
+                return
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event == "done":
+                    return
+        finally:
+            self._listeners.discard(queue)
+
+
+# Local work queue for batch jobs. `process(document, progress)` analyzes one SpooledDocument and returns
+# its result; it runs for at most `concurrency` documents at once. Copies of a document (same content hash)
+# submitted while it is being processed, in the same job or another one, share that run and its result.
+# A document's temporary file is removed once its result is in.
+class BatchQueue:
+    def __init__(self, process, concurrency=BATCH_CONCURRENCY, job_ttl=BATCH_JOB_TTL):
+        self.process = process
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight = {}
+        self._tasks = set()
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and now - job.finished > self.job_ttl:
+                del self.jobs[job_id]
+
+    # Utility to start a job for a list of SpooledDocuments (see spool_uploads); returns the job right away
+    def submit(self, documents):
+        self._expire()
+        job = BatchJob(str(uuid.uuid4()), [document.filename for document in documents])
+        self.jobs[job.job_id] = job
+        self._spawn(self._run_job(job, documents))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _run_job(self, job, documents):
+        await asyncio.gather(*(self._run_document(job, index, document) for index, document in enumerate(documents)))
+        job.finish()
+
+    async def _run_document(self, job, index, document):
+        document_id = document.document_id
+        job.update(index, document_id=document_id)
+
+        run = self._inflight.get(document_id)
+        if run is None:
+            run = self._inflight[document_id] = {"watchers": []}
+            run["task"] = self._spawn(self._process(document_id, document, run["watchers"]))
+        run["watchers"].append((job, index))
+
+        try:
+            result = await asyncio.shield(run["task"])
+        except Exception as e:
+            job.update(index, status="failed", error=str(e) or type(e).__name__)
+        else:
+            job.update(index, status="done", **result)
+        finally:
+            document.remove()
+
+    async def _process(self, document_id, document, watchers):
+        def progress(status):
+            for job, index in watchers:
+                job.update(index, status=status)
+
+        try:
+            async with self._semaphore:
+                return await self.process(document, progress)
+        finally:
+            del self._inflight[document_id]
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
@@ -0,0 +1,267 @@
+"""OpenAI-compatible chat completions stub for benchmarking the backend without a provider.
+
+Replies are canned courtroom lines picked from the agent's system prompt. Latency is modelled as a
+fixed time to first token, prefill of the uncached prompt tokens and a generation rate. Prompt
+caching works like OpenAI's: the longest previously seen prefix of whole messages, from 1024 tokens
+on and in steps of 128, is reported as cached_tokens. Every call's prompt size is counted so the
+benchmark can report LLM calls and prompt tokens per endpoint. With a concurrency limit, calls
+beyond it are rejected with 429 Too Many Requests, like a provider's rate limit.
+
+    python bench/mock_llm.py --port 8999 --latency 0.3 --tokens-per-second 80
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+REPLIES = {
+    "judge": [
+        "Thank you, counsel. The prosecution may proceed with cross-examination.",
+        "Objection overruled. The witness may answer the question.",
+        "Sustained. Counsel, please rephrase the question.",
+        "The defense may call its next witness.",
+    ],
+    "witness": [
+        "My name is Jordan Lee. I saw a grey sedan leave the parking lot at around nine that night.",
+        "I was standing near the entrance of the store, about thirty feet away.",
+        "I did not see the driver's face clearly, but the car had a dented rear bumper.",
+    ],
+    "defendant": [
+        "I was at home that evening. My neighbor saw me come in around eight.",
+        "No, I never lent my car to anyone that week.",
+        "I only learned about the accident the next morning from the news.",
+    ],
+    "attorney": [
+        "Isn't it true that you left the house shortly after eight thirty?",
+        "Can you describe the lighting conditions in the parking lot that night?",
+        "Your honor, I have no further questions. I am finished with questioning.",
+    ],
+    "feedback": [
+        "Your questions were focused and you kept the witness on the key facts of the timeline. "
+        "Consider laying more foundation before introducing the store receipt, and object sooner to leading questions.",
+    ],
+    "analysis": [
+        "The case concerns a hit-and-run in a store parking lot. The prosecution relies on an eyewitness and a damaged "
+        "vehicle, while the defense argues the identification is unreliable and offers an alibi from a neighbor.",
+    ],
+}
+
+_agent_list = re.compile(r"select the next role from \[([^\]]*)\]", re.IGNORECASE)
+
+
+KINDS = [
+    ("feedback", "feedback assistant"),
+    ("analysis", "legalanalysisagent"),
+    ("judge", "you are a judge"),
+    ("defendant", "you are the defendant"),
+    ("witness", "you are a witness"),
+    ("attorney", "attorney in this mock trial"),
+]
+
+
+def pick_reply(messages, rng):
+    systems = [str(m.get("content") or "").lower() for m in messages if m.get("role") == "system"]
+    last = str(messages[-1].get("content") or "") if messages else ""
+
+    match = _agent_list.search(last) or next(filter(None, (_agent_list.search(system) for system in systems)), None)
+    if match:
+        names = [name.strip().strip("'\"") for name in match.group(1).split(",") if name.strip()]
+        return rng.choice(names) if names else "judge_agent"
+    # Role instructions come after the case document in laid out prompts, so look from the last system message back
+    for system in reversed(systems):
+        for kind, marker in KINDS:
+            if marker in system[:2000]:
+                return rng.choice(REPLIES[kind])
+    return rng.choice(REPLIES["analysis"])
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+
+
+class MockLLM:
+    def __init__(self, latency=0.3, tokens_per_second=80.0, prefill_tokens_per_second=20000.0, seed=0, max_concurrency=0):
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.tokens_per_second = tokens_per_second
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self._prefixes = set()
+        self.rng = random.Random(seed)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {
+                "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "in_flight": 0, "peak_in_flight": 0,
+                "rate_limited": 0, "models": {},
+            }
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "models": dict(self.stats["models"])}
+
+    def complete(self, body):
+        messages = body.get("messages", [])
+        digest = hashlib.sha256()
+        prefixes = []
+        prompt_tokens = 0
+        for message in messages:
+            digest.update(json.dumps([message.get("role"), message.get("content")]).encode())
+            prompt_tokens += count_tokens(str(message.get("content") or "")) + 4
+            prefixes.append((digest.copy().hexdigest(), prompt_tokens))
+
+        with self._lock:
+            cached_tokens = 0
+            for prefix, tokens in prefixes:
+                if prefix in self._prefixes:
+                    cached_tokens = tokens
+            if cached_tokens < CACHE_MIN_TOKENS:
+                cached_tokens = 0
+            cached_tokens -= cached_tokens % CACHE_STEP_TOKENS
+            self._prefixes.update(prefix for prefix, tokens in prefixes if tokens >= CACHE_MIN_TOKENS)
+
+            reply = pick_reply(messages, self.rng)
+            self.stats["calls"] += 1
+            model = body.get("model", "mock")
+            self.stats["models"][model] = self.stats["models"].get(model, 0) + 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["cached_tokens"] += cached_tokens
+            self.stats["completion_tokens"] += count_tokens(reply)
+        return f"chatcmpl-mock-{next(self._ids)}", reply, prompt_tokens, cached_tokens
+
+    # Counts a call in or out; returns False, counting the call as rate limited, if it is over the limit
+    def track(self, delta):
+        with self._lock:
+            if delta > 0 and self.max_concurrency and self.stats["in_flight"] >= self.max_concurrency:
+                self.stats["rate_limited"] += 1
+                return False
+            self.stats["in_flight"] += delta
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+            return True
+
+
+def make_handler(llm):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload, status=200):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._send_json(llm.snapshot())
+            self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/stats/reset":
+                llm.reset()
+                return self._send_json({})
+            if not self.path.endswith("/chat/completions"):
+                return self._send_json({"error": "not found"}, 404)
+
+            if not llm.track(1):
+                return self._send_json({"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}, 429)
+            try:
+                completion_id, reply, prompt_tokens, cached_tokens = llm.complete(body)
+                model = body.get("model", "mock")
+                words = reply.split(" ")
+                per_word = (count_tokens(reply) / llm.tokens_per_second) / max(len(words), 1)
+                prefill = (prompt_tokens - cached_tokens) / llm.prefill_tokens_per_second if llm.prefill_tokens_per_second else 0
+                time.sleep(llm.latency + prefill)
+                if body.get("stream"):
+                    self._stream(completion_id, model, words, per_word)
+                else:
+                    time.sleep(per_word * len(words))
+                    self._send_json({
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": count_tokens(reply),
+                            "total_tokens": prompt_tokens + count_tokens(reply),
+                            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                        },
+                    })
+            finally:
+                llm.track(-1)
+
+        def _stream(self, completion_id, model, words, per_word):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for i, word in enumerate(words):
+                delta = {"role": "assistant", "content": word if i == 0 else " " + word}
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(per_word)
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+
+    return Handler
+
+
+def start_server(port=0, **kwargs):
+    llm = MockLLM(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(llm))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=20000.0, help="0 disables prefill time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="calls in flight before 429s (0: no limit)")
+    args = parser.parse_args()
+
+    server, _ = start_server(
+        args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        seed=args.seed,
+        max_concurrency=args.max_concurrency,
+    )
+    print(f"Mock LLM listening on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
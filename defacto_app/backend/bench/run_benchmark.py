@@ -0,0 +1,337 @@
+"""End-to-end load benchmark for the backend against the mock LLM.
+
+Starts bench/mock_llm.py in-process and the API under uvicorn, pointed at the mock through
+DEFACTO_LLM_BASE_URL, then walks N concurrent simulated students through every endpoint,
+one phase per endpoint so LLM calls and prompt tokens can be attributed to it:
+
+    simulation_initialize -> simulation_continue (x turns) -> simulation_feedback (x2)
+    -> analysis_initialize -> analysis_continue
+
+Reports p50/p95/p99 latency, requests/sec, LLM calls and prompt tokens per endpoint, and the
+server's peak RSS. Results are written to bench/results/<timestamp>.json; pass --compare with an
+earlier result to print the differences and fail on p95 regressions.
+
+    python bench/run_benchmark.py --students 20 --turns 3 --compare bench/results/baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_llm import start_server
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(BACKEND_DIR))
+DEFAULT_PDFS = [
+    os.path.join(REPO_ROOT, "mock_trial.pdf"),
+    os.path.join(REPO_ROOT, "Mini-Mock-Trial-State-v.-Anderson-2016.pdf"),
+]
+QUESTIONS = [
+    "Where were you on the night of the incident?",
+    "Can you tell the court what you saw in the parking lot?",
+    "Objection, your honor, the question is leading.",
+    "I have no further questions. I am finished with questioning.",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def post_json(base_url, path, payload, timeout):
+    request = urllib.request.Request(
+        base_url + path, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def post_pdf(base_url, path, pdf_path, fields, timeout):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    with open(pdf_path, "rb") as f:
+        pdf = f.read()
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="pdf"; filename="{os.path.basename(pdf_path)}"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n".encode() + pdf + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    request = urllib.request.Request(
+        base_url + path, data=b"".join(parts), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def peak_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def wait_until_up(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The API server exited during startup.")
+        try:
+            urllib.request.urlopen(base_url + "/docs", timeout=1).close()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError("The API server did not start in time.")
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.peak_llm_concurrency = 0
+        self.rate_limited = 0
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self.lock:
+            if ok:
+                self.latencies.append(seconds)
+            else:
+                self.errors += 1
+
+
+def run_phase(phase, students, work, mock, concurrency):
+    mock.reset()
+
+    def timed(student):
+        started = time.perf_counter()
+        try:
+            work(student)
+            phase.record(time.perf_counter() - started, True)
+        except Exception as e:
+            phase.record(time.perf_counter() - started, False)
+            student.setdefault("errors", []).append(f"{phase.name}: {e}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, students))
+    phase.elapsed += time.perf_counter() - started
+    llm = mock.snapshot()
+    phase.llm_calls += llm["calls"]
+    phase.prompt_tokens += llm["prompt_tokens"]
+    phase.cached_tokens += llm["cached_tokens"]
+    phase.peak_llm_concurrency = max(phase.peak_llm_concurrency, llm["peak_in_flight"])
+    phase.rate_limited += llm["rate_limited"]
+    for model, calls in llm["models"].items():
+        phase.models[model] = phase.models.get(model, 0) + calls
+
+
+def summarize(phase):
+    requests = len(phase.latencies) + phase.errors
+    return {
+        "requests": requests,
+        "errors": phase.errors,
+        "p50": percentile(phase.latencies, 50),
+        "p95": percentile(phase.latencies, 95),
+        "p99": percentile(phase.latencies, 99),
+        "mean": statistics.fmean(phase.latencies) if phase.latencies else None,
+        "requests_per_second": requests / phase.elapsed if phase.elapsed else None,
+        "llm_calls": phase.llm_calls,
+        "llm_calls_per_request": phase.llm_calls / requests if requests else None,
+        "prompt_tokens": phase.prompt_tokens,
+        "prompt_tokens_per_request": phase.prompt_tokens / requests if requests else None,
+        "cached_tokens": phase.cached_tokens,
+        "cached_ratio": phase.cached_tokens / phase.prompt_tokens if phase.prompt_tokens else None,
+        "peak_llm_concurrency": phase.peak_llm_concurrency,
+        "rate_limited": phase.rate_limited,
+        "llm_calls_by_model": phase.models,
+    }
+
+
+def run(args):
+    mock_server, mock = start_server(
+        0,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        seed=args.seed,
+        max_concurrency=args.mock_max_concurrency,
+    )
+    port = args.port
+    base_url = f"http://127.0.0.1:{port}"
+    cache_dir = tempfile.mkdtemp(prefix="defacto-bench-")
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-mock-" + "0" * 48,
+        "DEFACTO_LLM_BASE_URL": f"http://127.0.0.1:{mock_server.server_port}/v1",
+        "DEFACTO_CACHE_DIR": env.get("DEFACTO_CACHE_DIR", cache_dir) if args.warm_cache else cache_dir,
+    })
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    rng = random.Random(args.seed)
+    students = [{"id": i, "role": rng.choice(["DA", "PA"]), "pdf": args.pdf[i % len(args.pdf)]} for i in range(args.students)]
+    timeout = args.request_timeout
+
+    def simulation_initialize(student):
+        response = post_pdf(base_url, "/simulation/initialize", student["pdf"], {"role": student["role"]}, timeout)
+        student["session_id"] = response["session_id"]
+
+    def simulation_continue(student):
+        message = rng.choice(QUESTIONS)
+        post_json(base_url, "/simulation/continue", {"session_id": student["session_id"], "user_message": message}, timeout)
+
+    def simulation_feedback(student):
+        message = "How am I doing so far?"
+        post_json(base_url, "/simulation/feedback", {"session_id": student["session_id"], "user_message": message}, timeout)
+
+    def analysis_initialize(student):
+        response = post_pdf(base_url, "/analysis/initialize", student["pdf"], {}, timeout)
+        student["analysis_session_id"] = response["session_id"]
+
+    def analysis_continue(student):
+        message = "What is the strongest evidence for the defense?"
+        post_json(base_url, "/analysis/continue", {"session_id": student["analysis_session_id"], "user_message": message}, timeout)
+
+    phases = [("simulation_initialize", simulation_initialize)]
+    phases += [("simulation_continue", simulation_continue)] * args.turns
+    phases += [("simulation_feedback", simulation_feedback)] * 2
+    phases += [("analysis_initialize", analysis_initialize), ("analysis_continue", analysis_continue)]
+
+    results = {}
+    try:
+        wait_until_up(base_url, server)
+        for name, work in phases:
+            # Repeated phases (one per continue turn) are reported together
+            phase = results.setdefault(name, Phase(name))
+            ready = [s for s in students if not s.get("errors")]
+            run_phase(phase, ready, work, mock, args.students)
+        for name, phase in results.items():
+            print(format_row(name, summarize(phase)), flush=True)
+        peak_rss = peak_rss_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        mock_server.shutdown()
+    if peak_rss is None:
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    errors = [error for s in students for error in s.get("errors", [])]
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "students": args.students,
+            "turns": args.turns,
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "prefill_tokens_per_second": args.prefill_tokens_per_second,
+            "mock_max_concurrency": args.mock_max_concurrency,
+            "pdfs": [os.path.basename(p) for p in args.pdf],
+            "env": {key: value for key, value in os.environ.items() if key.startswith("DEFACTO_")},
+        },
+        "endpoints": {name: summarize(phase) for name, phase in results.items()},
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+        "errors": errors[:20],
+    }
+
+
+def fmt(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def format_row(name, r):
+    return (f"{name:24} n={r['requests']:<4} err={r['errors']:<3} p50={fmt(r['p50'])}s p95={fmt(r['p95'])}s "
+            f"p99={fmt(r['p99'])}s rps={fmt(r['requests_per_second'])} llm_calls/req={fmt(r['llm_calls_per_request'])} "
+            f"prompt_tokens/req={fmt(r['prompt_tokens_per_request'], 0)} cached={fmt((r.get('cached_ratio') or 0) * 100, 0)}% "
+            f"429s={r.get('rate_limited', 0)}")
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    print(f"\nCompared with {baseline['timestamp']}:")
+    for name, r in current["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ("p95", "llm_calls_per_request", "prompt_tokens_per_request"):
+            if r[key] is None or not before[key]:
+                continue
+            change = (r[key] - before[key]) / before[key] * 100
+            deltas.append(f"{key} {change:+.0f}%")
+            if key == "p95" and change > threshold:
+                regressions.append(f"{name} p95 {fmt(before[key])}s -> {fmt(r[key])}s")
+        print(f"  {name:24} " + ", ".join(deltas))
+    print(f"  peak RSS {baseline['peak_rss_mb']} MB -> {current['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=10, help="concurrent simulated students")
+    parser.add_argument("--turns", type=int, default=3, help="/simulation/continue calls per student")
+    parser.add_argument("--latency", type=float, default=0.3, help="mock LLM seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="mock LLM generation rate")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=20000.0, help="mock LLM uncached prompt rate")
+    parser.add_argument("--mock-max-concurrency", type=int, default=0, help="mock LLM calls in flight before 429s")
+    parser.add_argument("--pdf", action="append", help="case packet to upload (default: the bundled mock trials)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--request-timeout", type=float, default=300)
+    parser.add_argument("--warm-cache", action="store_true", help="reuse DEFACTO_CACHE_DIR instead of a fresh cache")
+    parser.add_argument("--output", help="result file (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=20.0, help="allowed p95 increase in percent")
+    parser.add_argument("--verbose", action="store_true", help="show the API server's log")
+    args = parser.parse_args()
+    args.pdf = args.pdf or DEFAULT_PDFS
+
+    result = run(args)
+    output = args.output or os.path.join(BACKEND_DIR, "bench", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nPeak RSS {result['peak_rss_mb']} MB, {len(result['errors'])} errors. Saved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.regression_threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
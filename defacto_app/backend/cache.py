@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+# Utility to compute the content hash used as a cache key
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Two tier (memory LRU + disk) cache for text values keyed by content hash
+class TieredCache:
+    suffix = ".txt"
+
+    def __init__(self, directory, max_memory_items=64, max_disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _dump(self, value):
+        return value.encode("utf-8")
+
+    def _load(self, data):
+        return data.decode("utf-8")
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = self._load(f.read())
+            except FileNotFoundError:
+                self.stats["misses"] += 1
+                return None
+
+            # Touch the file so disk eviction behaves like an LRU
+            os.utime(path)
+            self.stats["disk_hits"] += 1
+            self._remember(key, value)
+            return value
+
+    def set(self, key, value):
+        data = self._dump(value)
+        with self._lock:
+            self._remember(key, value)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            try:
+                self._disk_bytes -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            try:
+                size = os.path.getsize(self._path(key))
+                os.remove(self._path(key))
+                self._disk_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict_disk(self):
+        # Other processes may share the directory, so recount before evicting
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+
+        # Drop the least recently used files until we are back under budget
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats["disk_evictions"] += 1
+        self._disk_bytes = total
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# LLM completion cache with a time to live. It implements autogen's cache protocol, so it can be
+# passed as `cache=` to initiate_chat; autogen keys it on the model, messages and sampling parameters.
+class CompletionCache(TieredCache):
+    suffix = ".pkl"
+
+    def __init__(self, directory, ttl, **kwargs):
+        super().__init__(directory, **kwargs)
+        self.ttl = ttl
+        self.stats["expired"] = 0
+
+    def _dump(self, value):
+        return pickle.dumps(value)
+
+    def _load(self, data):
+        return pickle.loads(data)
+
+    # autogen's keys are request configs (a string or a JSON-able dict): hash them into file-safe keys
+    def _key(self, key):
+        if not isinstance(key, str):
+            key = json.dumps(key, sort_keys=True)
+        return content_hash(key.encode("utf-8"))
+
+    def get(self, key, default=None):
+        key = self._key(key)
+        entry = super().get(key)
+        if entry is None:
+            return default
+        created, value = entry
+        if time.time() - created > self.ttl:
+            self.delete(key)
+            with self._lock:
+                self.stats["expired"] += 1
+            return default
+        return value
+
+    def set(self, key, value):
+        super().set(self._key(key), (time.time(), value))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+CACHE_DIR = os.getenv("DEFACTO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+pdf_text_cache = TieredCache(
+    os.path.join(CACHE_DIR, "pdf_text"),
+    max_memory_items=int(os.getenv("DEFACTO_PDF_CACHE_MEMORY_ITEMS", "64")),
+    max_disk_bytes=int(os.getenv("DEFACTO_PDF_CACHE_DISK_MB", "256")) * 1024 * 1024,
+)
+
+completion_cache = CompletionCache(
+    os.path.join(CACHE_DIR, "completions"),
+    ttl=int(os.getenv("DEFACTO_LLM_CACHE_TTL", str(7 * 24 * 3600))),
+    max_memory_items=int(os.getenv("DEFACTO_LLM_CACHE_MEMORY_ITEMS", "512")),
+    max_disk_bytes=int(os.getenv("DEFACTO_LLM_CACHE_DISK_MB", "256")) * 1024 * 1024,
+)
+
+# Endpoints whose agent conversations read and write the completion cache
+LLM_CACHE_ENDPOINTS = set(filter(None, os.getenv(
+    "DEFACTO_LLM_CACHE_ENDPOINTS", "simulation_initialize,analysis_initialize"
+).split(",")))
+
+
+# Utility to get the completion cache for an endpoint, or None if caching is disabled for it
+def llm_cache_for(endpoint):
+    return completion_cache if endpoint in LLM_CACHE_ENDPOINTS else None
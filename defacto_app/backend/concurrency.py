@@ -0,0 +1,20 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Maximum number of agent conversations running at once in this worker
+LLM_CONCURRENCY = int(os.getenv("DEFACTO_LLM_CONCURRENCY", "16"))
+
+llm_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="llm")
+
+
+# Utility to run a blocking agent call (e.g. initiate_chat) without blocking the event loop.
+# The caller's context variables are carried over to the executor thread.
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(llm_executor, call)
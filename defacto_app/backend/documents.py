@@ -0,0 +1,94 @@
+import threading
+import weakref
+
+
+# Placeholder stored in messages instead of the document text; replaced when the prompt is built
+def document_reference(document_id):
+    return f"<<document:{document_id}>>"
+
+
+# A session's hold on a shared document. The store's reference count drops when the handle is
+# garbage collected, i.e. when the session and its agents are gone.
+class DocumentHandle:
+    __slots__ = ("document_id", "text", "reference", "__weakref__")
+
+    def __init__(self, store, document_id, text):
+        self.document_id = document_id
+        self.text = text
+        self.reference = document_reference(document_id)
+        weakref.finalize(self, store._release, document_id)
+
+
+# Case documents shared by all sessions and agents, keyed by content hash. One copy of each document
+# is kept while any session references it. `load(document_id)` fetches a document that is not resident.
+class DocumentStore:
+    def __init__(self, load):
+        self._load = load
+        self._documents = {}
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "shared": 0, "loads": 0, "released": 0}
+
+    def acquire(self, document_id, text=None):
+        with self._lock:
+            entry = self._documents.get(document_id)
+            if entry is not None:
+                entry[1] += 1
+                self.stats["acquired"] += 1
+                self.stats["shared"] += 1
+                return DocumentHandle(self, document_id, entry[0])
+
+        if text is None:
+            text = self._load(document_id)
+            if text is None:
+                raise KeyError(document_id)
+            self.stats["loads"] += 1
+
+        with self._lock:
+            entry = self._documents.setdefault(document_id, [text, 0])
+            entry[1] += 1
+            self.stats["acquired"] += 1
+            return DocumentHandle(self, document_id, entry[0])
+
+    def _release(self, document_id):
+        with self._lock:
+            entry = self._documents.get(document_id)
+            if entry is None:
+                return
+            entry[1] -= 1
+            self.stats["released"] += 1
+            if entry[1] <= 0:
+                del self._documents[document_id]
+
+    def get(self, document_id):
+        with self._lock:
+            entry = self._documents.get(document_id)
+        return entry[0] if entry is not None else None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["documents"] = len(self._documents)
+            stats["references"] = sum(count for _, count in self._documents.values())
+            stats["bytes"] = sum(len(text) for text, _ in self._documents.values())
+        return stats
+
+
+# Utility to give agents the document behind a handle when their prompt is built: references in the
+# messages are replaced by the text and, with prepend, the document is added as the first message.
+# Stored histories keep only the references.
+def attach_document(agents, handle, prepend=False):
+    def materialize(messages):
+        if not messages:
+            return messages
+        resolved = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str) and handle.reference in content:
+                message = {**message, "content": content.replace(handle.reference, handle.text)}
+            resolved.append(message)
+        if prepend:
+            resolved.insert(0, {"role": "system", "content": f"<context> {handle.text} </context>"})
+        return resolved
+
+    for agent in agents:
+        agent.register_hook("process_all_messages_before_reply", materialize)
@@ -0,0 +1,95 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+from cache import content_hash, pdf_text_cache
+from telemetry import span
+
+
+MAX_WORKERS = int(os.getenv("DEFACTO_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.getenv("DEFACTO_PDF_PAGES_PER_TASK", "8"))
+MAX_PDF_BYTES = int(os.getenv("DEFACTO_PDF_MAX_MB", "50")) * 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PdfTooLargeError(ValueError):
+    pass
+
+
+# Worker side: these run in the process pool and must stay importable at module level
+def _count_pages(data):
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_page_range(data, start, end):
+    with pdfplumber.open(io.BytesIO(data), pages=list(range(start + 1, end + 1))) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def check_pdf_size(data):
+    if len(data) > MAX_PDF_BYTES:
+        raise PdfTooLargeError(f"PDF is larger than {MAX_PDF_BYTES // (1024 * 1024)} MB.")
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps the workers independent of the server's threads and sockets
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+# Yields each page's text in order, as soon as the range holding it has been extracted.
+# Only MAX_WORKERS ranges of a document are in flight at once, which bounds the copies of
+# the document held by the workers.
+async def iter_pages(data):
+    check_pdf_size(data)
+
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    page_count = await loop.run_in_executor(pool, _count_pages, data)
+
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    pending = []
+    next_range = 0
+    try:
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < MAX_WORKERS:
+                start, end = ranges[next_range]
+                pending.append(loop.run_in_executor(pool, _extract_page_range, data, start, end))
+                next_range += 1
+            for page_text in await pending.pop(0):
+                yield page_text
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# Utility to extract the full text of an uploaded PDF without blocking the event loop
+async def extract_text(data):
+    key = content_hash(data)
+    with span("pdf_extraction"):
+        text = await asyncio.to_thread(pdf_text_cache.get, key)
+        if text is not None:
+            return text
+
+        text = "".join([page_text async for page_text in iter_pages(data)])
+        await asyncio.to_thread(pdf_text_cache.set, key, text)
+    return text
@@ -0,0 +1,67 @@
+import os
+
+from constants import (
+    feedback_prompt, questioning_feedback_prompt, objections_feedback_prompt, evidence_feedback_prompt,
+    procedure_feedback_prompt
+)
+from methods import create_feedback_agents
+
+
+# Focused evaluators asked for feedback at once: {aspect: (heading, prompt)}.
+# "general" is one overall tutor, as feedback was given before the evaluators.
+ASPECTS = {
+    "general": ("Overall", feedback_prompt),
+    "questioning": ("Questioning technique", questioning_feedback_prompt),
+    "objections": ("Objections", objections_feedback_prompt),
+    "evidence": ("Use of evidence", evidence_feedback_prompt),
+    "procedure": ("Procedure", procedure_feedback_prompt),
+}
+FEEDBACK_ASPECTS = [
+    aspect.strip()
+    for aspect in os.getenv("DEFACTO_FEEDBACK_ASPECTS", "questioning,objections,evidence,procedure").split(",")
+    if aspect.strip() in ASPECTS
+] or ["general"]
+
+
+# Utility to create the feedback evaluators of a session. Returns ({aspect: evaluator}, {aspect: human agent}).
+def create_feedback_panel(llm_config, aspects=FEEDBACK_ASPECTS):
+    evaluators, humans = {}, {}
+    for aspect in aspects:
+        name = "feedback_agent" if aspect == "general" else f"{aspect}_feedback_agent"
+        agents = create_feedback_agents(llm_config, name, ASPECTS[aspect][1])
+        evaluators[aspect] = agents["feedback_agent"]
+        humans[aspect] = agents["human_agent"]
+    return evaluators, humans
+
+
+# Utility to merge the evaluators' replies into one feedback message, under a heading per aspect.
+# `replies` is a list of (aspect, reply); a single evaluator's reply is used as is.
+def merge_feedback(replies):
+    if len(replies) == 1:
+        return replies[0][1]
+    return "\n\n".join(f"{ASPECTS[aspect][0]}: {reply.strip()}" for aspect, reply in replies)
+
+
+# The simulation as feedback evaluators read it: one line per message, grouped into turns, where a turn
+# starts with a message of the user. It follows the session's transcript, so every update only formats
+# the messages added since the last one.
+class TranscriptDigest:
+    def __init__(self, user_role):
+        self.user_role = user_role
+        self.turns = []
+        # The transcript's first message is the opening message with the courtroom procedure, which is left out
+        self.cursor = 1
+
+    def update(self, transcript):
+        for message in transcript.since(self.cursor):
+            speaker = message["name"] or f"{self.user_role} (user)"
+            if message["name"] is None or not self.turns:
+                self.turns.append([])
+            self.turns[-1].append(f"{speaker}: {message['content']}")
+        self.cursor = transcript.cursor
+
+    # Text of the turns from `turn` on
+    def text(self, turn=0):
+        return "\n\n".join(
+            f"Turn {number}:\n" + "\n".join(lines) for number, lines in enumerate(self.turns[turn:], start=turn + 1)
+        )
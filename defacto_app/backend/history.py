@@ -0,0 +1,151 @@
+import functools
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+KEEP_LAST = int(os.getenv("DEFACTO_HISTORY_KEEP_LAST", "8"))
+# Budget of a whole agent call: system prompt, case document or excerpts, and the history
+MAX_TOKENS = int(os.getenv("DEFACTO_HISTORY_MAX_TOKENS", "8000"))
+SUMMARY_LINE_CHARS = 200
+SUMMARY_HEADING = "Summary of the earlier proceedings:"
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken missing or its encoding files unavailable offline
+    _encoding = None
+
+
+@functools.lru_cache(maxsize=8192)
+def count_tokens(text):
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message):
+    # 4 tokens of per-message framing, as in OpenAI's chat format
+    return count_tokens(str(message.get("content") or "")) + 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Keep the beginning and the end, which carry the instructions and the latest content
+    keep = max_tokens * 2
+    if keep <= 0:
+        return "[...]"
+    return f"{text[:keep]}\n[...]\n{text[-keep:]}"
+
+
+_sentence_end = re.compile(r"(?<=[.!?])\s")
+
+
+def summarize_message(message):
+    content = " ".join(str(message.get("content") or "").split())
+    first_sentence = _sentence_end.split(content, maxsplit=1)[0]
+    if len(first_sentence) > SUMMARY_LINE_CHARS:
+        first_sentence = first_sentence[:SUMMARY_LINE_CHARS].rstrip() + "..."
+    return f"- {message.get('name') or message.get('role')}: {first_sentence}"
+
+
+# The message the window writes in place of the turns it folded
+def is_summary_message(message):
+    return str(message.get("content") or "").startswith(SUMMARY_HEADING)
+
+
+stats = {"turns": 0, "history_tokens": 0, "prompt_tokens": 0}
+_stats_lock = threading.Lock()
+
+
+def get_stats():
+    with _stats_lock:
+        result = dict(stats)
+    result["saved_tokens"] = result["history_tokens"] - result["prompt_tokens"]
+    return result
+
+
+# Keeps an agent's prompt to: the opening message, a running summary of older turns, and the last
+# keep_last turns verbatim, all within max_tokens together with the `reserved` tokens the rest of the
+# call takes (system prompt, case document or excerpts). The summary is extended incrementally as turns
+# fall out of the window, so each call only summarizes the newly folded turns.
+class HistoryWindow:
+    def __init__(self, agent_name, keep_last=KEEP_LAST, max_tokens=MAX_TOKENS, reserved=0):
+        self.agent_name = agent_name
+        self.keep_last = keep_last
+        self.max_tokens = max_tokens
+        self.reserved = reserved
+        self.summary_lines = []
+        self.folded = 1
+
+    def __call__(self, messages):
+        if not messages:
+            return messages
+
+        # History was cleared or replaced since the last call: start the summary over
+        if len(messages) < self.folded:
+            self.summary_lines = []
+            self.folded = 1
+
+        fold_until = max(self.folded, len(messages) - self.keep_last)
+        for message in messages[self.folded:fold_until]:
+            self.summary_lines.append(summarize_message(message))
+        self.folded = fold_until
+
+        recent = list(messages[fold_until:])
+        budget = self.max_tokens - self.reserved - sum(message_tokens(message) for message in recent)
+
+        # Fold the oldest verbatim turns into the summary too while they leave no room for the opening and
+        # their own summary lines (always keep the last one)
+        opening_tokens = message_tokens(messages[0])
+        folded_tokens = 0
+        while len(recent) > 1 and budget < opening_tokens + folded_tokens:
+            message = recent.pop(0)
+            line = summarize_message(message)
+            budget += message_tokens(message)
+            folded_tokens += count_tokens(line) + 1
+            self.summary_lines.append(line)
+            self.folded += 1
+
+        # The opening is shortened only to fit a budget left over; it is kept whole when there is none
+        opening = dict(messages[0])
+        if budget > 4:
+            opening["content"] = truncate_to_tokens(str(opening.get("content") or ""), budget - 4)
+        budget -= message_tokens(opening)
+
+        summary_lines = []
+        for line in reversed(self.summary_lines):
+            cost = count_tokens(line) + 1
+            if cost > budget:
+                break
+            summary_lines.insert(0, line)
+            budget -= cost
+
+        windowed = [opening]
+        if summary_lines:
+            summary = SUMMARY_HEADING + "\n" + "\n".join(summary_lines)
+            windowed.append({"role": "user", "content": summary})
+        windowed.extend(recent)
+
+        history_tokens = sum(message_tokens(message) for message in messages)
+        prompt_tokens = sum(message_tokens(message) for message in windowed)
+        with _stats_lock:
+            stats["turns"] += 1
+            stats["history_tokens"] += history_tokens
+            stats["prompt_tokens"] += prompt_tokens
+        logger.info("%s history: %d messages / %d tokens sent as %d messages / %d tokens",
+                    self.agent_name, len(messages), history_tokens, len(windowed), prompt_tokens)
+        return windowed
+
+
+# Utility to window the history each agent sends to the LLM. `reserved` is what the case takes in each
+# call (document or excerpts); each agent's own system prompt is counted on top of it.
+def attach_history_window(agents, keep_last=KEEP_LAST, max_tokens=MAX_TOKENS, reserved=0):
+    for agent in agents:
+        agent_reserved = reserved + count_tokens(agent.system_message or "") + 4
+        agent.register_hook(
+            "process_all_messages_before_reply", HistoryWindow(agent.name, keep_last, max_tokens, agent_reserved)
+        )
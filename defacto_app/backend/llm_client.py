@@ -0,0 +1,293 @@
+import contextlib
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from telemetry import (
+    METRICS_ENABLED, llm_in_flight, llm_queue_depth, llm_queue_wait, llm_retries, record_cached_tokens
+)
+
+
+# Model of every agent not listed in DEFACTO_LLM_AGENT_MODELS
+LLM_MODEL = os.getenv("DEFACTO_LLM_MODEL", "gpt-4o-mini")
+# Model per agent name, e.g. "witness_agent=gpt-4o-mini,defendant_agent=gpt-4o-mini,router=gpt-4o-mini".
+# "router" is the group chat manager, which picks the next speaker and writes the chat summaries.
+AGENT_MODELS = dict(
+    entry.strip().split("=", 1) for entry in os.getenv("DEFACTO_LLM_AGENT_MODELS", "").split(",") if "=" in entry
+)
+
+# Provider calls in flight at once in this worker, and per session
+LLM_MAX_IN_FLIGHT = int(os.getenv("DEFACTO_LLM_MAX_IN_FLIGHT", "16"))
+LLM_SESSION_MAX_IN_FLIGHT = int(os.getenv("DEFACTO_LLM_SESSION_MAX_IN_FLIGHT", "4"))
+# Seconds a call may wait for a slot before failing, and seconds a call may take
+LLM_QUEUE_TIMEOUT = float(os.getenv("DEFACTO_LLM_QUEUE_TIMEOUT", "30"))
+LLM_TIMEOUT = float(os.getenv("DEFACTO_LLM_TIMEOUT", "120"))
+# Retries of rate limited and failed calls, with exponential backoff and full jitter
+LLM_MAX_RETRIES = int(os.getenv("DEFACTO_LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("DEFACTO_LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("DEFACTO_LLM_BACKOFF_MAX", "8"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Session whose agents are making LLM calls in this context
+_current_session = contextvars.ContextVar("current_session", default=None)
+
+
+# Utility to attribute the LLM calls made in a block to a session, e.g. `with llm_session(session_id):`
+@contextlib.contextmanager
+def llm_session(session_id):
+    token = _current_session.set(session_id)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+# Concurrency slots for provider calls: one pool for the worker and one per session, so a burst
+# queues here instead of piling onto the provider, and one busy session cannot take every slot.
+# Calls that wait longer than `timeout` fail, which keeps the latency a burst adds bounded.
+class CallLimiter:
+    def __init__(
+        self, max_in_flight=LLM_MAX_IN_FLIGHT, session_max_in_flight=LLM_SESSION_MAX_IN_FLIGHT, timeout=LLM_QUEUE_TIMEOUT
+    ):
+        self.session_max_in_flight = session_max_in_flight
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # {session_id: [semaphore, calls using it]}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.waiting = {}
+        self.in_flight = {}
+        self.stats = {"calls": 0, "queued": 0, "timeouts": 0, "retries": 0}
+
+    def _count(self, counts, gauge, model, amount):
+        with self._lock:
+            counts[model] = counts.get(model, 0) + amount
+        if METRICS_ENABLED:
+            gauge.inc(amount, model)
+
+    def _session_slots(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = [threading.BoundedSemaphore(self.session_max_in_flight), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _leave_session(self, session_id):
+        with self._lock:
+            entry = self._sessions[session_id]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._sessions[session_id]
+
+    # Waits for a slot; returns a function releasing it, to be called exactly once
+    def acquire(self, model, session_id, request):
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        session_slots = self._session_slots(session_id) if session_id is not None else None
+
+        acquired = []
+        self._count(self.waiting, llm_queue_depth, model, 1)
+        try:
+            for slots in (session_slots, self._slots):
+                if slots is None:
+                    continue
+                if not slots.acquire(timeout=max(deadline - time.perf_counter(), 0)):
+                    with self._lock:
+                        self.stats["timeouts"] += 1
+                    raise httpx.PoolTimeout(f"No LLM call slot free after {self.timeout:g}s", request=request)
+                acquired.append(slots)
+        except BaseException:
+            for slots in acquired:
+                slots.release()
+            if session_slots is not None:
+                self._leave_session(session_id)
+            raise
+        finally:
+            self._count(self.waiting, llm_queue_depth, model, -1)
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.stats["calls"] += 1
+            if waited > 0.001:
+                self.stats["queued"] += 1
+        if METRICS_ENABLED:
+            llm_queue_wait.observe(waited, model)
+        self._count(self.in_flight, llm_in_flight, model, 1)
+
+        def release():
+            self._count(self.in_flight, llm_in_flight, model, -1)
+            for slots in acquired:
+                slots.release()
+            if session_slots is not None:
+                self._leave_session(session_id)
+
+        return release
+
+    def record_retry(self, model, reason):
+        with self._lock:
+            self.stats["retries"] += 1
+        if METRICS_ENABLED:
+            llm_retries.inc(1, model, reason)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "waiting": {model: count for model, count in self.waiting.items() if count},
+                "in_flight": {model: count for model, count in self.in_flight.items() if count},
+                "sessions": len(self._sessions),
+            }
+
+
+llm_limiter = CallLimiter()
+
+
+def get_llm_call_stats():
+    return llm_limiter.get_stats()
+
+
+# Body stream of a streamed response that gives its slot back when the response is closed
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if self._release is not None:
+                self._release, release = None, self._release
+                release()
+
+
+def _request_model(request):
+    try:
+        return json.loads(request.content).get("model") or "unknown"
+    except (ValueError, AttributeError):
+        return "unknown"
+
+
+# Seconds to wait before retry number `attempt`: the provider's Retry-After if given, else full jitter
+def _backoff(attempt, response=None):
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), LLM_BACKOFF_MAX)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(LLM_BACKOFF_BASE * 2 ** attempt, LLM_BACKOFF_MAX))
+
+
+# One connection pool to the LLM provider, shared by every agent of every session.
+# autogen deep-copies llm_config for each agent, so the copy must return the same client.
+# Completion calls go through the limiter and are retried here on 429s, server errors and failed
+# connections; the OpenAI client's own retries are turned off in get_llm_config.
+class SharedHttpClient(httpx.Client):
+    def __deepcopy__(self, memo):
+        return self
+
+    def send(self, request, **kwargs):
+        if not request.url.path.endswith("/chat/completions"):
+            return super().send(request, **kwargs)
+
+        model = _request_model(request)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            release = llm_limiter.acquire(model, _current_session.get(), request)
+            try:
+                response = super().send(request, **kwargs)
+            except httpx.ConnectError:
+                release()
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                llm_limiter.record_retry(model, "connect")
+                time.sleep(_backoff(attempt))
+                continue
+            except BaseException:
+                release()
+                raise
+
+            if response.status_code not in RETRY_STATUSES or attempt == LLM_MAX_RETRIES:
+                if kwargs.get("stream"):
+                    response.stream = _ReleasingStream(response.stream, release)
+                else:
+                    release()
+                return response
+
+            delay = _backoff(attempt, response)
+            response.close()
+            release()
+            llm_limiter.record_retry(model, str(response.status_code))
+            time.sleep(delay)
+
+
+prompt_cache_stats = {"responses": 0, "prompt_tokens": 0, "cached_tokens": 0}
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache_stats():
+    with _prompt_cache_lock:
+        stats = dict(prompt_cache_stats)
+    stats["cached_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+# Response hook reading how many prompt tokens the provider served from its prompt cache.
+# Streamed responses are left alone, they carry no usage.
+def _record_prompt_cache_usage(response):
+    if not response.request.url.path.endswith("/chat/completions") or response.status_code != 200:
+        return
+    if "text/event-stream" in response.headers.get("content-type", ""):
+        return
+    try:
+        usage = json.loads(response.read()).get("usage") or {}
+    except ValueError:
+        return
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    with _prompt_cache_lock:
+        prompt_cache_stats["responses"] += 1
+        prompt_cache_stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        prompt_cache_stats["cached_tokens"] += cached_tokens
+    record_cached_tokens(cached_tokens)
+
+
+shared_http_client = SharedHttpClient(
+    limits=httpx.Limits(
+        max_connections=int(os.getenv("DEFACTO_LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("DEFACTO_LLM_MAX_KEEPALIVE", "20")),
+    ),
+    event_hooks={"response": [_record_prompt_cache_usage]},
+)
+
+
+# Utility to build the LLM config from the environment, or None when no API key is configured.
+# DEFACTO_LLM_BASE_URL points the agents at any OpenAI-compatible server (e.g. the benchmark's mock).
+def get_llm_config():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    config = {
+        "model": LLM_MODEL,
+        "api_key": api_key,
+        "http_client": shared_http_client,
+        "timeout": LLM_TIMEOUT,
+        "max_retries": 0,
+    }
+    if os.getenv("DEFACTO_LLM_BASE_URL"):
+        config["base_url"] = os.getenv("DEFACTO_LLM_BASE_URL")
+    return {"config_list": [config]}
+
+
+# Utility to give an agent the model configured for it (see DEFACTO_LLM_AGENT_MODELS)
+def llm_config_for(llm_config, agent_name):
+    if not llm_config:
+        return llm_config
+    model = AGENT_MODELS.get(agent_name, LLM_MODEL)
+    return {**llm_config, "config_list": [{**config, "model": model} for config in llm_config["config_list"]]}
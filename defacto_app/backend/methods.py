@@ -1,64 +1,60 @@
-import pdfplumber
-from autogen import ConversableAgent, GroupChat, GroupChatManager
+from autogen import ConversableAgent
 from constants import (
     prosecuting_attorney_prompt, defense_attorney_prompt,
     judge_prompt, defendant_prompt, witness_prompt, 
     judge_description, defendant_description, witness_description,
     human_proxy_prosecuting_attorney_description, human_proxy_defense_attorney_description,
-    prosecuting_attorney_description, defense_attorney_description
+    prosecuting_attorney_description, defense_attorney_description,
+    legal_analysis_prompt, feedback_prompt
 )
-# Utility to create agents based on the role selected
-def create_agents(user_role, pdf_text, llm_config):
-    agents = {}
-
-    if user_role == "DA":
-        agents["prosecuting_attorney"] = ConversableAgent(
-            "prosecuting_attorney",
-            system_message = prosecuting_attorney_prompt,
-            llm_config = llm_config,
-            description = prosecuting_attorney_description
-        )
-        human_role = "defense_attorney"
-        human_description = human_proxy_defense_attorney_description
-    else:
-        agents["defense_attorney"] = ConversableAgent(
-            "defense_attorney",
+from llm_client import llm_config_for
+from telemetry import attach_reply_timing
+# Constructor arguments of every agent, per role selected, built once at import.
+# Agents are created from these templates; with the shared HTTP client in llm_config that is cheap.
+AGENT_TEMPLATES = {
+    "DA": {
+        "prosecuting_attorney": dict(
+            name="prosecuting_attorney",
+            system_message=prosecuting_attorney_prompt,
+            description=prosecuting_attorney_description,
+        ),
+        "human_proxy": dict(
+            name="human_proxy-defense_attorney",
+            human_input_mode="NEVER",
+            code_execution_config=False,
+            description=human_proxy_defense_attorney_description,
+        ),
+    },
+    "PA": {
+        "defense_attorney": dict(
+            name="defense_attorney",
             system_message=defense_attorney_prompt,
-            llm_config=llm_config,
-            description = defense_attorney_description
-        )
-        human_role = "prosecuting_attorney"
-        human_description = human_proxy_prosecuting_attorney_description
-
-    agents["human_proxy"] = ConversableAgent(
-        f"human_proxy-{human_role}",
-        human_input_mode="NEVER",
-        code_execution_config=False,
-        is_termination_msg=lambda message: True,
-        description=human_description
-    )
+            description=defense_attorney_description,
+        ),
+        "human_proxy": dict(
+            name="human_proxy-prosecuting_attorney",
+            human_input_mode="NEVER",
+            code_execution_config=False,
+            description=human_proxy_prosecuting_attorney_description,
+        ),
+    },
+}
 
-    agents["witness_agent"] = ConversableAgent(
-        name="witness_agent", 
-        system_message= witness_prompt, 
-        llm_config=llm_config, 
-        description = witness_description
-    )
-
-    agents["judge_agent"] = ConversableAgent(
-        "judge_agent", 
-        system_message = judge_prompt, 
-        llm_config=llm_config,  
-        description = judge_description,
-    )
+for role_templates in AGENT_TEMPLATES.values():
+    role_templates["witness_agent"] = dict(name="witness_agent", system_message=witness_prompt, description=witness_description)
+    role_templates["judge_agent"] = dict(name="judge_agent", system_message=judge_prompt, description=judge_description)
+    role_templates["defendant_agent"] = dict(name="defendant_agent", system_message=defendant_prompt, description=defendant_description)
 
-    agents["defendant_agent"] = ConversableAgent(
-        name="defendant_agent", 
-        system_message = defendant_prompt, 
-        llm_config=llm_config, 
-        description = defendant_description
-    )
 
+# Utility to create agents based on the role selected
+def create_agents(user_role, llm_config):
+    agents = {}
+    for key, template in AGENT_TEMPLATES[user_role].items():
+        if key == "human_proxy":
+            agents[key] = ConversableAgent(**template, is_termination_msg=lambda message: True)
+        else:
+            agents[key] = ConversableAgent(**template, llm_config=llm_config_for(llm_config, template["name"]))
+            attach_reply_timing([agents[key]])
     return agents
 
 def define_transitions(agents, user_role):
@@ -78,54 +74,107 @@ def define_transitions(agents, user_role):
     
     return disallowed_transitions
 
-# Utility to extract text from a PDF file
-def extract_text_from_pdf(file):
-    with pdfplumber.open(file) as pdf:
-        text = "".join([page.extract_text() for page in pdf.pages])
-    return text
+# Utility to build the opening message of a simulation
+def create_initial_message(human_proxy_role, context):
+    initial_message = f"""
+    I will be roleplaying as the {human_proxy_role} in this mock trial. We will begin with the direct examination, where the defendant is already on the stand, and I, as the {human_proxy_role}, will be starting the questioning. However, this simulation will cover the entire court proceeding, including cross-examinations, objections, and any other trial phases.
+
+    The prosecuting attorney should only speak after the judge has directly given them the floor, and the defense attorney should only speak after the prosecuting attorney has finished their questioning. The witnesses should only speak when directly addressed by the attorneys.
+
+    When an attorney says they are finished with questioning, the next speaker should always be the judge. The judge will then decide who has the floor next based on the courtroom procedure.
+
+    For context, the following document contains all the necessary details about the case, including background information, procedural context, and evidence:
+
+    {context}
+
+    Please ensure that all responses are appropriate for a courtroom setting, align with the role you are assigned, and adhere to the rules of courtroom procedure.
+    """
+    return initial_message
+
+# Names shown to the user for each agent; other speakers (the user's own messages) have no name
+DISPLAY_NAMES = {
+    "judge_agent": "Judge",
+    "prosecuting_attorney": "Prosecuting Attorney",
+    "defense_attorney": "Defense Attorney",
+    "witness_agent": "Witness",
+    "defendant_agent": "Defendant",
+    "legal_analysis_agent": "Tutor Donny Defacto",
+    "feedback_agent": "Tutor Donny Defacto",
+}
+
+
+def display_name(name):
+    return name if name == "assistant" else DISPLAY_NAMES.get(name)
+
 
-#Utility to parse agent names
+#Utility to parse agent names, returning copies of the messages with display names
 def parse_agent_names(chat_history):
-    for i,content in enumerate(chat_history):   
-        new_name = None
-        if content['name'] == "judge_agent":
-            new_name = "Judge"
-        elif content['name'] == "prosecuting_attorney":
-            new_name = "Prosecuting Attorney"
-        elif content['name'] == "defense_attorney":
-            new_name = "Defense Attorney"
-        elif content['name'] == "witness_agent":
-            new_name = "Witness"
-        elif content['name'] == "defendant_agent":
-            new_name = "Defendant"
-        elif content['name'] == "legal_analysis_agent":
-            new_name = "Tutor Donny Defacto"
-        elif content['name'] == "feedback_agent":
-            new_name = "Tutor Donny Defacto"
-        elif content['name'] == 'assistant':
-            continue
-
-        chat_history[i]['name'] = new_name
-    return chat_history
-
-
-def create_analysis_agents():
+    return [{**content, "name": display_name(content.get("name"))} for content in chat_history]
+
+
+def create_analysis_agents(context, llm_config):
     agents = {}
     agents['legal_analysis_agent'] = ConversableAgent(
         name="legal_analysis_agent", 
-        system_message=f"""
-        You are LegalAnalysisAgent, an AI expert in analyzing legal court proceedings. This is the court proceeding you will be analyzing: {pdf_text} Your primary role is to explain the reasoning behind the behavior, questioning style, and responses of participants in a court transcript, including attorneys, judges, witnesses, and other legal professionals. You should provide insights into the legal strategies, arguments, and tactics used by the participants. You can also provide general legal knowledge and context to help the user understand the legal proceedings better. Your goal is to help the user gain a deeper understanding of the legal aspects of the court transcript. You can also answer questions related to legal concepts, procedures, and strategies. You have access to a wide range of legal knowledge and can provide detailed explanations on legal topics. You should provide accurate, informative, and insightful responses to the user's questions.
-        """,
-        llm_config=llm_config, 
+        system_message=legal_analysis_prompt.format(context=context),
+        llm_config=llm_config_for(llm_config, "legal_analysis_agent"),
     )
 
     agents['human_agent'] = ConversableAgent(
         "human_agent",
         llm_config=False,
-        human_input_mode="ALWAYS",
+        human_input_mode="NEVER",
+        code_execution_config=False,
+        is_termination_msg=lambda message: True,
         description="""
         Human user asking questions to the feedback agent.
         """
     )
+    attach_reply_timing([agents['legal_analysis_agent']])
+
+    return agents
+
+
+# Utility to create a feedback agent and the human agent talking to it; every feedback agent
+# uses the model configured for "feedback_agent"
+def create_feedback_agents(llm_config, name="feedback_agent", system_message=feedback_prompt):
+    agents = {}
+    agents['feedback_agent'] = ConversableAgent(
+        name=name,
+        system_message=system_message,
+        llm_config=llm_config_for(llm_config, "feedback_agent"),
+    )
+
+    agents['human_agent'] = ConversableAgent(
+        "human_agent",
+        llm_config=False,
+        human_input_mode="NEVER",
+        is_termination_msg=lambda message: True,
+    )
+    attach_reply_timing([agents['feedback_agent']])
+
+    return agents
+
+
+# Utility to load a saved group chat transcript back into a freshly built group chat,
+# as if every message had been spoken in it
+def restore_group_chat(group_chat_manager, messages):
+    group_chat = group_chat_manager.groupchat
+    for message in messages:
+        speaker = group_chat.agent_by_name(message["name"])
+        for agent in group_chat.agents:
+            if agent is speaker:
+                agent.send(dict(message), group_chat_manager, request_reply=False, silent=True)
+            else:
+                group_chat_manager.send(dict(message), agent, request_reply=False, silent=True)
+        group_chat.append(dict(message), speaker)
+
 
-    return agents
\ No newline at end of file
+# Utility to load a saved two agent chat history (seen from the sender's side) back into the agents
+def restore_chat(sender, recipient, chat_history):
+    for message in chat_history:
+        content = {"content": message["content"]}
+        if message["role"] == "assistant":
+            sender.send(content, recipient, request_reply=False, silent=True)
+        else:
+            recipient.send(content, sender, request_reply=False, silent=True)
@@ -0,0 +1,39 @@
+import os
+
+from constants import prompt_preamble
+
+
+# "prefix" lays prompts out for provider-side prefix caching, "legacy" keeps each agent's role prompt as its system message
+PROMPT_LAYOUT = os.getenv("DEFACTO_PROMPT_LAYOUT", "prefix")
+PREFIX_LAYOUT = PROMPT_LAYOUT == "prefix"
+
+
+# Utility to lay out agents' prompts so providers can cache their common prefix. Every prompt is rebuilt as:
+#   shared preamble, case document, opening message (courtroom procedure), role instructions, history, volatile content
+# The part before the role instructions is byte-identical for all agents, turns and sessions on the same packet
+# and user role; content that changes every turn (e.g. retrieved excerpts) stays at the end.
+# `document` is a DocumentHandle, or None when the document is not inlined; with opening=False the
+# conversation has no shared opening message (analysis and feedback chats).
+def attach_prompt_layout(agents, document=None, opening=True):
+    for agent in agents:
+        instructions = {"role": "system", "content": agent.system_message}
+        agent.update_system_message(prompt_preamble)
+
+        def layout(messages, instructions=instructions):
+            if not messages:
+                return messages
+            prefix = []
+            if document is not None:
+                prefix.append({"role": "system", "content": f"<context> {document.text} </context>"})
+            messages = list(messages)
+            if opening:
+                # The opening is the conversation's first message. It is not always messages[0]: what the other
+                # hooks add for the current turn only (retrieved excerpts) are system messages and can come
+                # before it on the first turn, and always follow it here.
+                index = next((i for i, message in enumerate(messages) if message.get("role") != "system"), None)
+                if index is not None:
+                    prefix.append(messages.pop(index))
+            return prefix + [instructions] + messages
+
+        # Registered last, so it sees the windowed history and the retrieved excerpts
+        agent.register_hook("process_all_messages_before_reply", layout)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+
+# Requests of a session that may wait behind the one running; 0 turns concurrent requests away
+SESSION_QUEUE_DEPTH = int(os.getenv("DEFACTO_SESSION_QUEUE_DEPTH", "4"))
+
+
+class SessionBusyError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Runs the requests of each session one at a time, in arrival order, so two requests never drive the
+# same agents at once. A request identical to one already waiting or running (same session and key,
+# e.g. a double-clicked send) shares that run and its result instead of starting another.
+class SessionRequestQueue:
+    def __init__(self, depth=SESSION_QUEUE_DEPTH):
+        self.depth = depth
+        # {session_id: {"tail": last task queued, "requests": {key: (task, shared)}}}
+        self._sessions = {}
+        self.stats = {"runs": 0, "coalesced": 0, "queued": 0, "rejected": 0}
+
+    # Utility to queue `work()` (a coroutine function) for a session. Returns (task running it, shared),
+    # where `shared` is the object given by the first of identical requests (e.g. the events of a stream).
+    # Raises SessionBusyError when the session's queue is full.
+    def submit(self, session_id, key, work, shared=None):
+        state = self._sessions.setdefault(session_id, {"tail": None, "requests": {}})
+        entry = state["requests"].get(key)
+        if entry is not None:
+            self.stats["coalesced"] += 1
+            return entry
+
+        if len(state["requests"]) > self.depth:
+            self.stats["rejected"] += 1
+            if self.depth == 0:
+                raise SessionBusyError("A request for this session is already running.", 409)
+            raise SessionBusyError("Too many requests queued for this session.", 429)
+
+        previous = state["tail"]
+
+        async def run():
+            if previous is not None:
+                await asyncio.wait([previous])
+            return await work()
+
+        task = asyncio.create_task(run())
+        self.stats["runs"] += 1
+        if previous is not None and not previous.done():
+            self.stats["queued"] += 1
+        state["requests"][key] = (task, shared)
+        state["tail"] = task
+        task.add_done_callback(lambda _: self._finish(session_id, key, task))
+        return task, shared
+
+    def _finish(self, session_id, key, task):
+        state = self._sessions.get(session_id)
+        if state is None:
+            return
+        if state["requests"].get(key, (None,))[0] is task:
+            del state["requests"][key]
+        if state["tail"] is task:
+            del self._sessions[session_id]
+
+    def get_stats(self):
+        return {**self.stats, "active_sessions": len(self._sessions)}
@@ -0,0 +1,170 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from documents import document_reference
+from history import count_tokens, is_summary_message
+
+
+# "retrieval" sends agents only the passages relevant to each turn, "full" inlines the whole document
+CONTEXT_MODE = os.getenv("DEFACTO_CONTEXT_MODE", "retrieval")
+RETRIEVAL_ENABLED = CONTEXT_MODE == "retrieval"
+TOP_K = int(os.getenv("DEFACTO_RETRIEVAL_TOP_K", "4"))
+CHUNK_WORDS = int(os.getenv("DEFACTO_RETRIEVAL_CHUNK_WORDS", "180"))
+CHUNK_OVERLAP = int(os.getenv("DEFACTO_RETRIEVAL_CHUNK_OVERLAP", "40"))
+# Optional sentence-transformers model used alongside BM25, e.g. "all-MiniLM-L6-v2"
+EMBEDDING_MODEL = os.getenv("DEFACTO_EMBEDDING_MODEL")
+
+DOCUMENT_NOTE = "<context> The case document is given at the start of the conversation. </context>"
+RETRIEVAL_NOTE = "<context> Excerpts of the case document relevant to each turn are provided alongside the conversation as <case_excerpts>. Rely on them for the facts of the case. </context>"
+
+STOPWORDS = set("""
+a an and are as at be but by did do does for from had has have he her him his i if in into is it its
+me my no not of on or our she so than that the their them then there these they this to was we were
+what when where which who will with you your
+""".split())
+
+SUMMARY_WORDS = {"summarize", "summary", "summarise", "overview", "outline"}
+
+_token_pattern = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in _token_pattern.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    words = text.split()
+    step = max(1, chunk_words - overlap)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, max(len(words) - overlap, 1), step)]
+
+
+# Okapi BM25 over the chunks of one document, optionally fused with embedding similarity
+class DocumentIndex:
+    def __init__(self, text, k1=1.5, b=0.75):
+        self.chunks = chunk_text(text)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = []
+        for i, chunk in enumerate(self.chunks):
+            counts = Counter(tokenize(chunk))
+            self.lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings.setdefault(term, []).append((i, count))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.embeddings = _embed(self.chunks) if EMBEDDING_MODEL else None
+
+    def _bm25(self, query):
+        scores = [0.0] * len(self.chunks)
+        n = len(self.chunks)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, count in postings:
+                norm = count + self.k1 * (1 - self.b + self.b * self.lengths[i] / self.average_length)
+                scores[i] += idf * count * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query, k=TOP_K):
+        if not self.chunks:
+            return []
+
+        # Broad requests ("summarize the document") match no passage in particular: spread over the document
+        if SUMMARY_WORDS & set(tokenize(query)):
+            step = max(1, len(self.chunks) // k)
+            return self.chunks[::step][:k]
+
+        scores = self._bm25(query)
+        ranked = [i for i in sorted(range(len(scores)), key=lambda i: -scores[i]) if scores[i] > 0]
+        if self.embeddings is not None:
+            ranked = _fuse(ranked, _rank_by_embedding(self.embeddings, query))
+        if not ranked:
+            ranked = list(range(len(self.chunks)))
+
+        # Keep document order so the excerpts read naturally
+        return [self.chunks[i] for i in sorted(ranked[:k])]
+
+    # Most tokens the excerpts of one turn can take (see attach_retrieval), whatever the query
+    def excerpt_tokens(self, k=TOP_K):
+        largest = sorted((count_tokens(chunk) for chunk in self.chunks), reverse=True)[:k]
+        return sum(largest) + 2 * len(largest) + 16
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def _embed(texts):
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            from sentence_transformers import SentenceTransformer
+            _embedder = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedder.encode(texts, normalize_embeddings=True)
+
+
+def _rank_by_embedding(embeddings, query):
+    similarities = embeddings @ _embed([query])[0]
+    return list(similarities.argsort()[::-1])
+
+
+# Reciprocal rank fusion of two rankings
+def _fuse(first, second, k=60):
+    scores = {}
+    for ranking in (first, second):
+        for rank, i in enumerate(ranking):
+            scores[int(i)] = scores.get(int(i), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda i: -scores[i])
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+# Utility to get the index of a document, building it once per document hash
+def get_document_index(document_id, text, max_indexes=32):
+    with _indexes_lock:
+        index = _indexes.get(document_id)
+        if index is not None:
+            _indexes.move_to_end(document_id)
+            return index
+
+    index = DocumentIndex(text)
+    with _indexes_lock:
+        _indexes[document_id] = index
+        while len(_indexes) > max_indexes:
+            _indexes.popitem(last=False)
+    return index
+
+
+# Utility to render the document for prompts: a pointer to the per-turn excerpts, or in full mode a
+# reference to the shared document (see documents.py), or with inline=False a pointer to the document
+# given at the start of the conversation
+def document_context(document_id, inline=True):
+    if RETRIEVAL_ENABLED:
+        return RETRIEVAL_NOTE
+    if not inline:
+        return DOCUMENT_NOTE
+    return f"<context> {document_reference(document_id)} </context>"
+
+
+# Utility to give each agent the passages relevant to the turn it is answering.
+# The excerpts are added to the prompt only, never to the stored history.
+def attach_retrieval(agents, index, k=TOP_K):
+    def add_excerpts(messages):
+        if not messages:
+            return messages
+        # The last exchange, not the summary the history window wrote in place of older turns
+        exchange = [message for message in messages if not is_summary_message(message)][-2:]
+        query = " ".join(str(message.get("content") or "")[-1000:] for message in exchange)
+        excerpts = "\n\n".join(index.search(query, k))
+        excerpt_message = {"role": "system", "content": f"<case_excerpts>\n{excerpts}\n</case_excerpts>"}
+        return messages[:-1] + [excerpt_message] + messages[-1:]
+
+    for agent in agents:
+        agent.register_hook("process_all_messages_before_reply", add_excerpts)
@@ -0,0 +1,469 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from autogen import ConversableAgent, GroupChatManager
+
+
+# Raised when a session is saved over a newer snapshot, saved by another worker since this one loaded it
+class SnapshotConflictError(Exception):
+    def __init__(self, session_id):
+        super().__init__(f"Session {session_id} was changed by another request. Reload it and try again.")
+        self.session_id = session_id
+
+
+# Rough resident size of a session: every message copy held by its agents plus their system prompts
+def estimate_session_bytes(session):
+    total = 0
+    for value in session.values():
+        agents = value.values() if isinstance(value, dict) else [value]
+        for agent in agents:
+            if not isinstance(agent, ConversableAgent):
+                continue
+            total += len(agent.system_message or "")
+            for messages in agent.chat_messages.values():
+                total += sum(len(str(message.get("content") or "")) for message in messages)
+            if isinstance(agent, GroupChatManager):
+                total += sum(len(str(message.get("content") or "")) for message in agent.groupchat.messages)
+    return total
+
+
+# Snapshots kept in this process only. They count against the session store's memory budget, and a
+# case document is kept only as long as a snapshot refers to it.
+class MemorySnapshotBackend:
+    shared = False
+
+    def __init__(self):
+        # {session_id: (version, data, updated_at, document_id)}
+        self._snapshots = {}
+        # {document_id: (text, added_at)}
+        self._documents = {}
+        # {document_id: snapshots referring to it}
+        self._document_refs = {}
+        # {key: status record of background work}
+        self._statuses = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._snapshots.get(session_id)
+        if entry is None:
+            return None, 0
+        return json.loads(entry[1]), entry[0]
+
+    def version(self, session_id):
+        with self._lock:
+            entry = self._snapshots.get(session_id)
+        return entry[0] if entry else 0
+
+    def save(self, session_id, snapshot, expected_version=None):
+        data = json.dumps(snapshot)
+        document_id = snapshot.get("document")
+        with self._lock:
+            previous = self._snapshots.get(session_id)
+            current = previous[0] if previous else 0
+            if expected_version is not None and current != expected_version:
+                raise SnapshotConflictError(session_id)
+            version = current + 1
+            self._snapshots[session_id] = (version, data, time.time(), document_id)
+            self._bytes += len(data)
+            if document_id is not None:
+                self._document_refs[document_id] = self._document_refs.get(document_id, 0) + 1
+            if previous:
+                self._drop_snapshot(previous)
+        return version
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._snapshots.pop(session_id, None)
+            if entry:
+                self._drop_snapshot(entry)
+
+    def expire(self, max_age):
+        cutoff = time.time() - max_age
+        with self._lock:
+            for session_id in [key for key, entry in self._snapshots.items() if entry[2] < cutoff]:
+                self._drop_snapshot(self._snapshots.pop(session_id))
+            # Documents no session was ever saved with (e.g. failed initializations)
+            for document_id in [
+                key for key, entry in self._documents.items() if entry[1] < cutoff and key not in self._document_refs
+            ]:
+                self._bytes -= len(self._documents.pop(document_id)[0])
+            for key in [key for key, record in self._statuses.items() if record["updated_at"] < cutoff]:
+                del self._statuses[key]
+
+    # Drops the least recently saved snapshots, except those of the sessions in `keep`, until at most
+    # max_bytes are held. Returns how many were dropped.
+    def trim(self, max_bytes, keep=()):
+        dropped = 0
+        with self._lock:
+            for session_id, entry in sorted(self._snapshots.items(), key=lambda item: item[1][2]):
+                if self._bytes <= max_bytes:
+                    break
+                if session_id in keep:
+                    continue
+                del self._snapshots[session_id]
+                self._drop_snapshot(entry)
+                dropped += 1
+        return dropped
+
+    def resident_bytes(self):
+        with self._lock:
+            return self._bytes
+
+    def put_document(self, document_id, text):
+        with self._lock:
+            if document_id not in self._documents:
+                self._documents[document_id] = (text, time.time())
+                self._bytes += len(text)
+
+    def get_document(self, document_id):
+        with self._lock:
+            entry = self._documents.get(document_id)
+        return entry[0] if entry else None
+
+    def put_status(self, key, record):
+        with self._lock:
+            self._statuses[key] = dict(record)
+
+    def get_status(self, key):
+        with self._lock:
+            record = self._statuses.get(key)
+        return dict(record) if record else None
+
+    def delete_status(self, key):
+        with self._lock:
+            self._statuses.pop(key, None)
+
+    # Releases a snapshot's bytes and its document reference; the document goes with its last snapshot
+    def _drop_snapshot(self, entry):
+        self._bytes -= len(entry[1])
+        document_id = entry[3]
+        if document_id is None:
+            return
+        self._document_refs[document_id] -= 1
+        if not self._document_refs[document_id]:
+            del self._document_refs[document_id]
+            document = self._documents.pop(document_id, None)
+            if document:
+                self._bytes -= len(document[0])
+
+
+# Snapshots kept in a SQLite file, so every uvicorn worker pointing at it sees the same sessions
+class SQLiteSnapshotBackend:
+    shared = True
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL, data TEXT NOT NULL, document TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, text TEXT NOT NULL, added_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Files created before sessions recorded their document
+            self._add_column("sessions", "document TEXT")
+            self._add_column("documents", "added_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_document ON sessions (document)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS statuses (id TEXT PRIMARY KEY, updated_at REAL NOT NULL, data TEXT NOT NULL)"
+            )
+
+    def _add_column(self, table, column):
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if column.split()[0] not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            if table == "sessions":
+                self._conn.execute("UPDATE sessions SET document = json_extract(data, '$.document')")
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data, version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def version(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    # Saves the snapshot as the session's next version. With expected_version, only if the stored
+    # snapshot is still at that version (0: none stored yet); raises SnapshotConflictError otherwise.
+    def save(self, session_id, snapshot, expected_version=None):
+        data = json.dumps(snapshot)
+        values = (time.time(), data, snapshot.get("document"))
+        with self._lock:
+            if expected_version is None:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, version, updated_at, data, document) VALUES (?, 1, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at, "
+                    "data = excluded.data, document = excluded.document",
+                    (session_id, *values),
+                )
+                return self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+
+            if expected_version == 0:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions (id, version, updated_at, data, document) VALUES (?, 1, ?, ?, ?)",
+                    (session_id, *values),
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE sessions SET version = version + 1, updated_at = ?, data = ?, document = ? "
+                    "WHERE id = ? AND version = ?",
+                    (*values, session_id, expected_version),
+                )
+        if cursor.rowcount != 1:
+            raise SnapshotConflictError(session_id)
+        return expected_version + 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    # Drops old sessions and, in the same transaction, the documents no remaining session refers to.
+    # Documents no session was saved with yet are kept as long as sessions are (e.g. while the
+    # opening rounds of a new session run).
+    def expire(self, max_age):
+        cutoff = time.time() - max_age
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+                self._conn.execute(
+                    "DELETE FROM documents WHERE added_at < ? "
+                    "AND NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.document = documents.id)",
+                    (cutoff,),
+                )
+                self._conn.execute("DELETE FROM statuses WHERE updated_at < ?", (cutoff,))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # Snapshots live on disk: nothing to trim from memory
+    def trim(self, max_bytes, keep=()):
+        return 0
+
+    def resident_bytes(self):
+        return 0
+
+    def put_document(self, document_id, text):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO documents (id, text, added_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET added_at = excluded.added_at",
+                (document_id, text, time.time()),
+            )
+
+    def get_document(self, document_id):
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM documents WHERE id = ?", (document_id,)).fetchone()
+        return row[0] if row else None
+
+    def put_status(self, key, record):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO statuses (id, updated_at, data) VALUES (?, ?, ?)",
+                (key, record["updated_at"], json.dumps(record)),
+            )
+
+    def get_status(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM statuses WHERE id = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_status(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM statuses WHERE id = ?", (key,))
+
+
+# Holds live sessions (agents, group chats) in memory and their snapshots in a backend.
+# Live sessions idle for longer than idle_ttl, or beyond the memory budget (least recently
+# used first), are dropped from memory and rebuilt from their snapshot on the next access.
+# Sessions with a request in flight (see in_use) are never dropped.
+class SessionStore:
+    def __init__(self, backend, snapshot, restore, idle_ttl=1800, max_memory_bytes=512 * 1024 * 1024, retention=7 * 24 * 3600):
+        self.backend = backend
+        self._snapshot = snapshot
+        self._restore = restore
+        self.idle_ttl = idle_ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.retention = retention
+        self._live = OrderedDict()
+        # {session_id: requests in flight}
+        self._in_use = {}
+        self._lock = threading.Lock()
+        self._last_expire = time.time()
+        self.stats = {"restores": 0, "ttl_evictions": 0, "memory_evictions": 0, "snapshot_evictions": 0, "conflicts": 0}
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id, session):
+        self.save(session_id, session)
+
+    def get(self, session_id, default=None):
+        with self._lock:
+            entry = self._live.get(session_id)
+        if entry is not None and (not self.backend.shared or self.backend.version(session_id) <= entry["version"]):
+            with self._lock:
+                entry["last_access"] = time.time()
+                self._live.move_to_end(session_id)
+            self._evict()
+            return entry["session"]
+
+        # Not live here (evicted, restarted, or updated by another worker): rebuild it
+        snapshot, version = self.backend.load(session_id)
+        if snapshot is None:
+            return default
+        session = self._restore(snapshot)
+        self.stats["restores"] += 1
+        self._remember(session_id, session, version)
+        return session
+
+    # Persists the session's current state; call after every request that changes it. A session loaded
+    # here is only saved over the snapshot it was loaded from: if another worker saved the session in
+    # the meantime, SnapshotConflictError is raised and the next access loads that worker's snapshot.
+    def save(self, session_id, session):
+        with self._lock:
+            entry = self._live.get(session_id)
+        expected_version = entry["version"] if entry is not None and entry["session"] is session else None
+        try:
+            version = self.backend.save(session_id, self._snapshot(session), expected_version)
+        except SnapshotConflictError:
+            with self._lock:
+                self._live.pop(session_id, None)
+            self.stats["conflicts"] += 1
+            raise
+        self._remember(session_id, session, version)
+
+    # Keeps the session live while a request works on it, so the session it saves is the one clients
+    # get next, instead of one rebuilt from an older snapshot after an eviction
+    @contextmanager
+    def in_use(self, session_id):
+        with self._lock:
+            self._in_use[session_id] = self._in_use.get(session_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[session_id] -= 1
+                if not self._in_use[session_id]:
+                    del self._in_use[session_id]
+            self._evict()
+
+    def pop(self, session_id, default=None):
+        session = self.get(session_id, default)
+        with self._lock:
+            self._live.pop(session_id, None)
+        self.backend.delete(session_id)
+        return session
+
+    def put_document(self, document_id, text):
+        self.backend.put_document(document_id, text)
+
+    def get_document(self, document_id):
+        return self.backend.get_document(document_id)
+
+    # Status records of background work on sessions (see background.py), shared like the snapshots
+    def put_status(self, key, record):
+        self.backend.put_status(key, record)
+
+    def get_status(self, key):
+        return self.backend.get_status(key)
+
+    def delete_status(self, key):
+        self.backend.delete_status(key)
+
+    def _remember(self, session_id, session, version):
+        with self._lock:
+            self._live[session_id] = {
+                "session": session,
+                "version": version,
+                "last_access": time.time(),
+                "bytes": estimate_session_bytes(session),
+            }
+            self._live.move_to_end(session_id)
+        self._evict()
+
+    def _evict(self):
+        now = time.time()
+        with self._lock:
+            idle = [
+                key for key, entry in self._live.items()
+                if now - entry["last_access"] > self.idle_ttl and key not in self._in_use
+            ]
+            for session_id in idle:
+                del self._live[session_id]
+                self.stats["ttl_evictions"] += 1
+
+            # Least recently used first, always keeping the most recent one. Snapshots held in memory
+            # count too: evicted sessions stay restorable from them.
+            live_bytes = sum(entry["bytes"] for entry in self._live.values())
+            total = live_bytes + self.backend.resident_bytes()
+            for session_id in list(self._live)[:-1]:
+                if total <= self.max_memory_bytes:
+                    break
+                if session_id in self._in_use:
+                    continue
+                evicted = self._live.pop(session_id)["bytes"]
+                live_bytes -= evicted
+                total -= evicted
+                self.stats["memory_evictions"] += 1
+            keep = set(self._live) | set(self._in_use)
+
+            expire = now - self._last_expire > 60
+            if expire:
+                self._last_expire = now
+        if expire:
+            self.backend.expire(self.retention)
+        # Still over budget with only snapshots left to drop: the oldest sessions that are not live are lost
+        if total > self.max_memory_bytes:
+            dropped = self.backend.trim(self.max_memory_bytes - live_bytes, keep)
+            with self._lock:
+                self.stats["snapshot_evictions"] += dropped
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["live_sessions"] = len(self._live)
+            stats["in_use_sessions"] = len(self._in_use)
+            stats["live_bytes"] = sum(entry["bytes"] for entry in self._live.values())
+        stats["snapshot_bytes"] = self.backend.resident_bytes()
+        return stats
+
+
+# Utility to build the session store configured through the environment
+def create_session_store(snapshot, restore):
+    if os.getenv("DEFACTO_SESSION_BACKEND", "memory") == "sqlite":
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sessions.sqlite3")
+        backend = SQLiteSnapshotBackend(os.getenv("DEFACTO_SESSION_DB", default_path))
+    else:
+        backend = MemorySnapshotBackend()
+
+    return SessionStore(
+        backend,
+        snapshot,
+        restore,
+        idle_ttl=int(os.getenv("DEFACTO_SESSION_IDLE_TTL", "1800")),
+        max_memory_bytes=int(os.getenv("DEFACTO_SESSION_MEMORY_MB", "512")) * 1024 * 1024,
+        retention=int(os.getenv("DEFACTO_SESSION_RETENTION", str(7 * 24 * 3600))),
+    )
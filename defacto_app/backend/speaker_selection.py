@@ -0,0 +1,121 @@
+import os
+import re
+import threading
+
+from retrieval import STOPWORDS
+
+# "rules" uses the courtroom state machine below, "auto" always asks the LLM
+SPEAKER_SELECTION = os.getenv("DEFACTO_SPEAKER_SELECTION", "rules")
+
+
+FINISHED_PATTERN = re.compile(
+    r"\b(finished|no further questions|nothing further|pass the witness|rest (?:our|my|the) case|the (?:prosecution|defense) rests)\b",
+    re.IGNORECASE,
+)
+OBJECTION_PATTERN = re.compile(r"\bobjection\b", re.IGNORECASE)
+CALL_PATTERN = re.compile(r"\bcalls?\b", re.IGNORECASE)
+# Only the lead-in ignores case; the name itself must be capitalized words
+NAME_PATTERN = re.compile(r"\b(?i:my name is|i am|i'm)\s+((?:[A-Z][a-z]+\.?\s?){1,3})")
+
+stats = {"rule": 0, "llm": 0, "end_of_round": 0}
+_stats_lock = threading.Lock()
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(stats)
+
+
+def _count(outcome):
+    with _stats_lock:
+        stats[outcome] += 1
+
+
+# Deterministic courtroom turn-taking, used as the GroupChat speaker_selection_method.
+# Picks the next speaker from the last message when the procedure makes it obvious, ends the
+# round when it is the user's turn, and otherwise falls back to the LLM ("auto") selection.
+class CourtroomSpeakerSelector:
+    def __init__(self, agents, user_role):
+        self.judge = agents["judge_agent"]
+        self.witness = agents["witness_agent"]
+        self.defendant = agents["defendant_agent"]
+        self.human = agents["human_proxy"]
+        self.opponent = agents["prosecuting_attorney"] if user_role == "DA" else agents["defense_attorney"]
+        if user_role == "DA":
+            self.attorneys_by_word = {"prosecut": self.opponent, "defense": self.human, "defence": self.human}
+        else:
+            self.attorneys_by_word = {"prosecut": self.human, "defense": self.opponent, "defence": self.opponent}
+        self.attorneys = {self.human, self.opponent}
+        self.testifiers = {self.witness, self.defendant}
+
+        # The trial opens with the defendant on the stand
+        self.on_stand = self.defendant
+        self.last_examiner = self.human
+        self.names = {}
+        self.seen = 0
+
+    def _observe(self, groupchat):
+        for message in groupchat.messages[self.seen:]:
+            speaker = groupchat.agent_by_name(message.get("name", ""))
+            content = str(message.get("content") or "")
+            if speaker in self.testifiers:
+                self.on_stand = speaker
+                for name in NAME_PATTERN.findall(content):
+                    for part in name.split():
+                        if len(part) > 2 and part.strip(".").lower() not in STOPWORDS:
+                            self.names[part.strip(".").lower()] = speaker
+            elif speaker in self.attorneys:
+                self.last_examiner = speaker
+        self.seen = len(groupchat.messages)
+
+    def _addressed_testifier(self, content):
+        lowered = content.lower()
+        for name, agent in self.names.items():
+            if re.search(rf"\b{re.escape(name)}\b", lowered):
+                return agent
+        if "defendant" in lowered and "witness" not in lowered:
+            return self.defendant
+        if "witness" in lowered and "defendant" not in lowered:
+            return self.witness
+        return None
+
+    def _next_speaker(self, last_speaker, content):
+        if last_speaker in self.attorneys:
+            if FINISHED_PATTERN.search(content) or OBJECTION_PATTERN.search(content):
+                return self.judge
+            if content.rstrip().endswith("?"):
+                return self._addressed_testifier(content) or self.on_stand
+            if CALL_PATTERN.search(content):
+                return self._addressed_testifier(content)
+            return None
+
+        if last_speaker in self.testifiers:
+            # The answer goes back to whoever is examining
+            return self.last_examiner
+
+        if last_speaker is self.judge:
+            lowered = content.lower()
+            floor = {agent for word, agent in self.attorneys_by_word.items() if word in lowered}
+            if len(floor) == 1:
+                return floor.pop()
+            if not floor:
+                return self._addressed_testifier(content)
+        return None
+
+    def __call__(self, last_speaker, groupchat):
+        self._observe(groupchat)
+        # The opening message sets up the whole trial and names every role: let the LLM pick
+        if len(groupchat.messages) < 2:
+            speaker = None
+        else:
+            speaker = self._next_speaker(last_speaker, str(groupchat.messages[-1].get("content") or ""))
+
+        if speaker is self.human:
+            # The user speaks through the API: hand the floor back by ending the round
+            _count("end_of_round")
+            return None
+        if speaker is None or speaker not in groupchat.allowed_speaker_transitions_dict.get(last_speaker, []):
+            _count("llm")
+            return "auto"
+        _count("rule")
+        return speaker
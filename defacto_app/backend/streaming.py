@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+import functools
+import json
+
+from autogen.events.client_events import StreamEvent
+from autogen.io.base import IOStream
+
+from concurrency import llm_executor
+from methods import parse_agent_names
+
+
+# Set only while a chat is being streamed; the hooks below are no-ops otherwise
+_event_listener = contextvars.ContextVar("event_listener", default=None)
+
+
+# Output stream that forwards LLM token deltas to the current listener and drops console output
+class _TokenStream:
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        pass
+
+    def send(self, message):
+        listener = _event_listener.get()
+        if listener is not None and isinstance(message, StreamEvent):
+            listener("token", {"content": message.content.content})
+
+    def input(self, prompt="", *, password=False):
+        return ""
+
+
+def _forward_message(sender, message, recipient, silent):
+    listener = _event_listener.get()
+    if listener is not None:
+        content = message.get("content") if isinstance(message, dict) else message
+        parsed = parse_agent_names([{"content": content, "role": "user", "name": sender.name}])
+        listener("message", parsed[0])
+    return message
+
+
+# Utility to make the agents report each message they send to the active stream, if any
+def attach_message_stream(agents):
+    for agent in agents:
+        agent.register_hook("process_message_before_send", _forward_message)
+
+
+# Utility to run a blocking agent call while yielding (event, data) pairs as the agents speak.
+# The last pair is ("result", <return value of func>).
+async def stream_chat(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def listener(event, data):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    def run():
+        _event_listener.set(listener)
+        with IOStream.set_default(_TokenStream()):
+            return func(*args, **kwargs)
+
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(llm_executor, functools.partial(context.run, run))
+    future.add_done_callback(lambda _: queue.put_nowait(None))
+
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        yield item
+    yield "result", future.result()
+
+
+# Events of a stream that several clients may follow: `feed` consumes the source, and each
+# `replay` yields every event from the start, then the new ones until the source is exhausted
+class StreamReplay:
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self._changed = asyncio.Condition()
+
+    async def feed(self, events):
+        try:
+            async for event in events:
+                async with self._changed:
+                    self.events.append(event)
+                    self._changed.notify_all()
+        finally:
+            async with self._changed:
+                self.finished = True
+                self._changed.notify_all()
+
+    async def replay(self):
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.events) or self.finished)
+                events = self.events[index:]
+                finished = self.finished
+            for event in events:
+                yield event
+            index += len(events)
+            if finished and index == len(self.events):
+                return
+
+
+# Utility to format a server-sent event
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,288 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+
+from autogen import GroupChat
+
+
+# Prometheus metrics served at /metrics
+METRICS_ENABLED = os.getenv("DEFACTO_METRICS", "1") == "1"
+# Per-request timing breakdown in a Server-Timing response header
+SERVER_TIMING = os.getenv("DEFACTO_SERVER_TIMING", "0") == "1"
+TRACING_ENABLED = METRICS_ENABLED or SERVER_TIMING
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+# Name of the agent whose reply is being generated in this context, for attributing LLM calls
+_current_agent = contextvars.ContextVar("current_agent", default=None)
+
+# Span totals of the current request, {span: [seconds, count]}; None unless Server-Timing is on
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _format_labels(label_names, values):
+    if not label_names:
+        return ""
+    pairs = []
+    for name, value in zip(label_names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount=1, *labels):
+        self.inc(-amount, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # {labels: [per bucket counts (last one is +Inf), sum]}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        label_names = self.label_names + ("le",)
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(label_names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+request_duration = Histogram(
+    "defacto_http_request_duration_seconds", "Time spent serving HTTP requests.", ("method", "route", "status")
+)
+span_duration = Histogram(
+    "defacto_span_duration_seconds",
+    "Time spent in PDF extraction, agent conversations, agent replies and speaker selection.",
+    ("span", "name"),
+)
+llm_tokens = Counter(
+    "defacto_llm_tokens_total", "Tokens billed by the LLM provider, per agent (cache hits excluded).", ("agent", "type")
+)
+llm_cached_tokens = Counter(
+    "defacto_llm_cached_prompt_tokens_total", "Prompt tokens served from the provider's prompt cache, per agent.", ("agent",)
+)
+llm_queue_depth = Gauge("defacto_llm_queue_depth", "LLM calls waiting for a concurrency slot, per model.", ("model",))
+llm_in_flight = Gauge("defacto_llm_in_flight", "LLM calls in flight to the provider, per model.", ("model",))
+llm_queue_wait = Histogram(
+    "defacto_llm_queue_wait_seconds", "Time LLM calls waited for a concurrency slot, per model.", ("model",)
+)
+llm_retries = Counter(
+    "defacto_llm_retries_total", "LLM calls retried after a rate limit or server error, per model.", ("model", "reason")
+)
+METRICS = [
+    request_duration, span_duration, llm_tokens, llm_cached_tokens, llm_queue_depth, llm_in_flight, llm_queue_wait, llm_retries
+]
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Outside agent replies (speaker selection, summaries) the agent is reported as "other"
+def record_cached_tokens(tokens):
+    if METRICS_ENABLED and tokens:
+        llm_cached_tokens.inc(tokens, _current_agent.get() or "other")
+
+
+def record_span(span, seconds, name=""):
+    if METRICS_ENABLED:
+        span_duration.observe(seconds, span, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(span, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+class _Span:
+    __slots__ = ("span", "name", "started")
+
+    def __init__(self, span, name):
+        self.span = span
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record_span(self.span, time.perf_counter() - self.started, self.name)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_noop_span = _NoopSpan()
+
+
+# Utility to time a block of work, e.g. `with span("initiate_chat", "simulation_continue"):`
+def span(span, name=""):
+    if not TRACING_ENABLED:
+        return _noop_span
+    return _Span(span, name)
+
+
+# Times each reply of an agent, from the start of generate_reply to the message being sent,
+# and counts the tokens its LLM client was billed for in between
+class ReplyTimer:
+    def __init__(self, agent):
+        self.agent = agent
+        self.started = None
+        self.tokens = (0, 0)
+
+    def _billed_tokens(self):
+        summary = getattr(getattr(self.agent, "client", None), "actual_usage_summary", None) or {}
+        prompt_tokens = completion_tokens = 0
+        for usage in summary.values():
+            if isinstance(usage, dict):
+                prompt_tokens += usage.get("prompt_tokens", 0)
+                completion_tokens += usage.get("completion_tokens", 0)
+        return prompt_tokens, completion_tokens
+
+    def start(self, agent, messages):
+        self.started = time.perf_counter()
+        _current_agent.set(self.agent.name)
+
+    def finish(self, sender, message, recipient, silent):
+        if self.started is None:
+            return message
+        record_span("agent_reply", time.perf_counter() - self.started, self.agent.name)
+        self.started = None
+        _current_agent.set(None)
+
+        tokens = self._billed_tokens()
+        if METRICS_ENABLED and tokens != self.tokens:
+            llm_tokens.inc(tokens[0] - self.tokens[0], self.agent.name, "prompt")
+            llm_tokens.inc(tokens[1] - self.tokens[1], self.agent.name, "completion")
+        self.tokens = tokens
+        return message
+
+
+# Utility to time the replies of LLM agents; does nothing when tracing is disabled
+def attach_reply_timing(agents):
+    if not TRACING_ENABLED:
+        return
+    for agent in agents:
+        timer = ReplyTimer(agent)
+        agent.register_hook("update_agent_state", timer.start)
+        agent.register_hook("process_message_before_send", timer.finish)
+
+
+# GroupChat that times speaker selection, including the LLM router fallback
+class TimedGroupChat(GroupChat):
+    def select_speaker(self, last_speaker, selector):
+        with span("speaker_selection"):
+            return super().select_speaker(last_speaker, selector)
+
+    async def a_select_speaker(self, last_speaker, selector):
+        with span("speaker_selection"):
+            return await super().a_select_speaker(last_speaker, selector)
+
+
+def format_server_timing(timings, total):
+    entries = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (seconds, count) in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+# ASGI middleware recording request durations, and adding the Server-Timing header when enabled.
+# For streamed responses the header only covers the work done before the stream started.
+class RequestTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {} if SERVER_TIMING else None
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    header = format_server_timing(timings, time.perf_counter() - started)
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            if METRICS_ENABLED:
+                # Label by route template, so unknown paths cannot blow up the number of series
+                route = getattr(scope.get("route"), "path", "unmatched")
+                request_duration.observe(time.perf_counter() - started, scope["method"], route, str(status))
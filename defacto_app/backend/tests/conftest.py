@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKETS_DIR = os.path.dirname(os.path.dirname(BACKEND_DIR))
+
+# The backend modules are imported as top-level modules, as uvicorn does from the backend directory
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+# Caches are configured at import: keep the tests' out of the backend's .cache directory
+os.environ.setdefault("DEFACTO_CACHE_DIR", tempfile.mkdtemp(prefix="defacto-tests-"))
+
+
+# The benchmark's mock LLM, with the agents pointed at it
+@pytest.fixture
+def mock_llm(monkeypatch):
+    from mock_llm import start_server
+
+    server, llm = start_server(latency=0.02, tokens_per_second=2000.0, prefill_tokens_per_second=0)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-mock-" + "0" * 48)
+    monkeypatch.setenv("DEFACTO_LLM_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    yield llm
+    server.shutdown()
+
+
+@pytest.fixture
+def case_pdf():
+    with open(os.path.join(PACKETS_DIR, "Mini-Mock-Trial-State-v.-Anderson-2016.pdf"), "rb") as f:
+        return f.read()
@@ -0,0 +1,47 @@
+import asyncio
+import io
+import json
+
+from starlette.datastructures import UploadFile
+
+
+def endpoint(path):
+    import app
+
+    return next(route.endpoint for route in app.app.routes if getattr(route, "path", None) == path)
+
+
+def parse_sse(chunk):
+    lines = chunk.strip().split("\n")
+    return lines[0].removeprefix("event: "), json.loads(lines[1].removeprefix("data: "))
+
+
+def test_continue_sent_mid_stream_waits_for_the_opening_rounds(mock_llm, case_pdf):
+    import app
+
+    mock_llm.latency = 0.2
+
+    async def scenario():
+        response = await endpoint("/simulation/stream/initialize")(
+            pdf=UploadFile(io.BytesIO(case_pdf), filename="case.pdf"), role="DA"
+        )
+        events = response.body_iterator
+        event, data = parse_sse(await anext(events))
+        assert event == "session"
+        session_id = data["session_id"]
+
+        # Sent as soon as the client has the session id, while the opening rounds still run
+        request = app.ContinueConversationRequest(session_id=session_id, user_message="Where were you that night?")
+        continued = asyncio.create_task(endpoint("/simulation/continue")(request))
+        streamed = [parse_sse(chunk) async for chunk in events]
+        return session_id, streamed, await continued
+
+    session_id, streamed, continued = asyncio.run(scenario())
+
+    assert streamed[-1][0] == "done"
+    opening_cursor = streamed[-1][1]["cursor"]
+    transcript = app.sessions[session_id]["transcript"].messages
+    assert [message["seq"] for message in transcript] == list(range(1, len(transcript) + 1))
+    # The user's question follows every message of the opening rounds
+    assert transcript[opening_cursor]["content"] == "Where were you that night?"
+    assert continued["response"][0]["seq"] > opening_cursor
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from background import BackgroundRegistry
+from session_store import SQLiteSnapshotBackend
+
+
+# Two workers sharing one SQLite session backend
+def make_workers(tmp_path):
+    backend = SQLiteSnapshotBackend(str(tmp_path / "sessions.sqlite3"))
+    return BackgroundRegistry(records=backend), BackgroundRegistry(records=backend)
+
+
+def test_other_worker_sees_and_waits_for_pending_work(tmp_path):
+    worker, other = make_workers(tmp_path)
+
+    async def scenario():
+        release = asyncio.Event()
+        done = []
+
+        async def initialize(work):
+            work.status = "opening"
+            await release.wait()
+            done.append(True)
+
+        worker.start("session", initialize)
+        await asyncio.sleep(0)
+        assert other.get("session").to_dict() == {"status": "opening", "response": []}
+
+        waiting = asyncio.create_task(other.wait("session"))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        release.set()
+        assert await waiting is None
+        assert done == [True]
+        assert other.get("session") is None
+
+    asyncio.run(scenario())
+
+
+def test_other_worker_sees_the_failure(tmp_path):
+    worker, other = make_workers(tmp_path)
+
+    async def scenario():
+        async def initialize(work):
+            raise ValueError("no text in the PDF")
+
+        await worker.start("session", initialize).task
+        failed = await other.wait("session")
+        assert failed.to_dict() == {"status": "failed", "response": [], "error": "no text in the PDF"}
+
+    asyncio.run(scenario())
+
+
+def test_work_lost_with_its_worker_is_reported_as_failed(tmp_path):
+    _, other = make_workers(tmp_path)
+    other.records.put_status("session", {"status": "opening", "error": None, "updated_at": time.time() - 3600})
+    assert asyncio.run(other.wait("session")).status == "failed"
@@ -0,0 +1,45 @@
+import asyncio
+import io
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from batch import BatchQueue, BatchTooLargeError, spool_uploads
+from cache import content_hash
+
+
+def uploads(*contents):
+    return [UploadFile(io.BytesIO(data), filename=f"case{i}.pdf") for i, data in enumerate(contents)]
+
+
+def test_batch_over_the_size_limit_is_rejected_and_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    with pytest.raises(BatchTooLargeError):
+        asyncio.run(spool_uploads(uploads(b"a" * 600, b"b" * 600), max_bytes=1000))
+    assert os.listdir(tmp_path) == []
+
+
+def test_documents_are_read_from_their_files_and_removed_once_done(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    processed = []
+
+    async def process(document, progress):
+        processed.append(document.read())
+        return {"summary": document.filename}
+
+    async def scenario():
+        documents = await spool_uploads(uploads(b"first case", b"second case", b"first case"))
+        assert [document.document_id for document in documents][0] == content_hash(b"first case")
+        assert len(os.listdir(tmp_path)) == 3
+
+        queue = BatchQueue(process, concurrency=1)
+        job = queue.submit(documents)
+        await asyncio.gather(*queue._tasks)
+        return job
+
+    job = asyncio.run(scenario())
+    assert sorted(processed) == [b"first case", b"second case"]
+    assert [document["status"] for document in job.documents] == ["done"] * 3
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,69 @@
+import os
+
+from cache import TieredCache, content_hash
+
+
+def test_cached_text_survives_a_restart(tmp_path):
+    key = content_hash(b"%PDF case packet")
+    TieredCache(str(tmp_path)).set(key, "The State of Mocktrial v. Anderson")
+
+    # A new process starts with an empty memory tier and finds the text on disk
+    restarted = TieredCache(str(tmp_path))
+    assert restarted.get(key) == "The State of Mocktrial v. Anderson"
+    assert restarted.get(key) == "The State of Mocktrial v. Anderson"
+    assert restarted.get(content_hash(b"other")) is None
+    stats = restarted.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["disk_bytes"] == len("The State of Mocktrial v. Anderson")
+
+
+def test_least_recently_used_files_are_evicted_past_the_disk_budget(tmp_path):
+    cache = TieredCache(str(tmp_path), max_memory_items=1, max_disk_bytes=250)
+    for i, key in enumerate(["a", "b"]):
+        cache.set(key, "x" * 100)
+        os.utime(tmp_path / f"{key}.txt", (i, i))
+    cache.get("a")
+    cache.set("c", "x" * 100)
+
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "c.txt"]
+    assert cache.get_stats()["disk_evictions"] == 1
+    assert cache.get_stats()["disk_bytes"] == 200
+
+
+def test_completion_cache_key_covers_model_and_streaming(mock_llm, monkeypatch, tmp_path):
+    from autogen import OpenAIWrapper
+
+    import llm_client
+    from cache import CompletionCache
+
+    monkeypatch.setattr(llm_client, "AGENT_MODELS", {"judge_agent": "gpt-4o"})
+    cache = CompletionCache(str(tmp_path), ttl=3600)
+    messages = [{"role": "user", "content": "Please state your name for the record."}]
+
+    def complete(agent_name="witness_agent", **params):
+        client = OpenAIWrapper(**llm_client.llm_config_for(llm_client.get_llm_config(), agent_name))
+        response = client.create(messages=messages, cache=cache, **params)
+        return client.extract_text_or_completion_object(response)[0]
+
+    first = complete()
+    assert complete() == first
+    assert mock_llm.snapshot()["calls"] == 1
+
+    # The same messages to another model, or with streamed tokens, are other requests
+    complete("judge_agent")
+    complete(stream=True)
+    assert mock_llm.snapshot()["models"] == {"gpt-4o-mini": 2, "gpt-4o": 1}
+    complete("judge_agent")
+    complete(stream=True)
+    assert mock_llm.snapshot()["calls"] == 3
+    assert cache.get_stats()["memory_hits"] == 3
+
+
+def test_expired_completion_is_a_miss(tmp_path):
+    from cache import CompletionCache
+
+    cache = CompletionCache(str(tmp_path), ttl=-1)
+    cache.set({"model": "gpt-4o-mini", "messages": []}, "answer")
+    assert cache.get({"model": "gpt-4o-mini", "messages": []}) is None
+    assert cache.get_stats()["expired"] == 1
+    assert os.listdir(tmp_path) == []
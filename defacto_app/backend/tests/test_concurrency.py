@@ -0,0 +1,48 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from concurrency import LLM_CONCURRENCY, run_blocking
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_blocking_calls_run_off_the_loop_with_the_callers_context():
+    def call(suffix):
+        return threading.current_thread().name, f"{request_id.get()}{suffix}"
+
+    async def scenario():
+        request_id.set("request-1")
+        return await run_blocking(call, suffix="!")
+
+    thread_name, value = asyncio.run(scenario())
+    assert thread_name.startswith("llm")
+    assert value == "request-1!"
+
+
+def test_conversations_beyond_the_limit_wait_for_a_thread():
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def conversation():
+        with lock:
+            running.append(1)
+            most.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    async def scenario():
+        calls = asyncio.gather(*(run_blocking(conversation) for _ in range(LLM_CONCURRENCY + 4)))
+        # The loop keeps serving other work meanwhile
+        ticks = 0
+        while not calls.done():
+            ticks += 1
+            await asyncio.sleep(0.005)
+        await calls
+        return ticks
+
+    assert asyncio.run(scenario()) > 5
+    assert max(most) == LLM_CONCURRENCY
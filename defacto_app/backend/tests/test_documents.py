@@ -0,0 +1,49 @@
+import gc
+
+import pytest
+
+from documents import DocumentStore, attach_document
+
+
+def test_document_is_released_with_the_last_handle():
+    loads = []
+    store = DocumentStore(load=lambda document_id: loads.append(document_id) or "reloaded text")
+    first = store.acquire("doc", "case text")
+    second = store.acquire("doc")
+    assert second.text is first.text
+    assert store.get_stats()["references"] == 2
+
+    del first
+    gc.collect()
+    assert store.get("doc") == "case text"
+
+    del second
+    gc.collect()
+    assert store.get("doc") is None
+    assert store.get_stats() == {
+        "acquired": 2, "shared": 1, "loads": 0, "released": 2, "documents": 0, "references": 0, "bytes": 0
+    }
+
+    # Once released, the next session loads it again
+    assert store.acquire("doc").text == "reloaded text"
+    assert loads == ["doc"]
+
+
+def test_unknown_document_is_a_key_error():
+    store = DocumentStore(load=lambda document_id: None)
+    with pytest.raises(KeyError):
+        store.acquire("missing")
+
+
+def test_prompts_get_the_text_and_the_history_keeps_the_reference():
+    from autogen import ConversableAgent
+
+    store = DocumentStore(load=lambda document_id: None)
+    handle = store.acquire("doc", "The full case packet.")
+    agent = ConversableAgent(name="judge_agent", system_message="You are the judge.", llm_config=False)
+    attach_document([agent], handle)
+    messages = [{"role": "user", "content": f"Here is the case: {handle.reference}"}]
+
+    prompt = agent.process_all_messages_before_reply(messages)
+    assert prompt[0]["content"] == "Here is the case: The full case packet."
+    assert messages[0]["content"] == f"Here is the case: {handle.reference}"
@@ -0,0 +1,33 @@
+import asyncio
+import io
+
+import pdfplumber
+import pytest
+
+import extraction
+from extraction import PdfTooLargeError, iter_pages
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # One page per task on two workers: pages come back from several ranges in flight at once
+    monkeypatch.setattr(extraction, "PAGES_PER_TASK", 1)
+    monkeypatch.setattr(extraction, "MAX_WORKERS", 2)
+    yield
+    extraction.shutdown_pool()
+
+
+def test_pages_come_back_in_document_order(pool, case_pdf):
+    async def extract():
+        return [page async for page in iter_pages(case_pdf)]
+
+    with pdfplumber.open(io.BytesIO(case_pdf)) as pdf:
+        expected = [page.extract_text() or "" for page in pdf.pages]
+    assert len(expected) > 1
+    assert asyncio.run(extract()) == expected
+
+
+def test_oversized_pdf_is_rejected_before_extraction(monkeypatch):
+    monkeypatch.setattr(extraction, "MAX_PDF_BYTES", 10)
+    with pytest.raises(PdfTooLargeError):
+        asyncio.run(anext(iter_pages(b"%PDF-1.4 " + b"0" * 10)))
@@ -0,0 +1,26 @@
+from feedback import TranscriptDigest, merge_feedback
+from transcript import Transcript
+
+
+def test_merge_feedback_puts_each_reply_under_a_plain_heading():
+    merged = merge_feedback([("questioning", " Ask shorter questions. "), ("objections", "Object sooner.")])
+    assert merged == "Questioning technique: Ask shorter questions.\n\nObjections: Object sooner."
+
+
+def test_merge_feedback_keeps_a_single_reply_as_is():
+    assert merge_feedback([("general", "Well done.")]) == "Well done."
+
+
+def test_digest_groups_messages_into_turns_of_the_user():
+    transcript = Transcript()
+    transcript.extend([
+        {"content": "Opening message", "role": "user", "name": None},
+        {"content": "The defense may begin.", "role": "user", "name": "judge_agent"},
+        {"content": "Where were you?", "role": "user", "name": None},
+        {"content": "At home.", "role": "user", "name": "defendant_agent"},
+    ])
+    digest = TranscriptDigest("defense attorney")
+    digest.update(transcript)
+    assert len(digest.turns) == 2
+    assert "Opening message" not in digest.text()
+    assert digest.text(1) == "Turn 2:\ndefense attorney (user): Where were you?\nDefendant: At home."
@@ -0,0 +1,63 @@
+from history import HistoryWindow, message_tokens
+
+
+def make_history(turns, words=200):
+    messages = [{"role": "user", "name": "human_proxy", "content": "Opening message. The trial begins."}]
+    for turn in range(1, turns + 1):
+        messages.append({"role": "user", "name": f"agent_{turn}", "content": f"Turn {turn} answer. " + "word " * words})
+    return messages
+
+
+def test_short_history_is_sent_as_is():
+    messages = make_history(3)
+    assert HistoryWindow("judge_agent", keep_last=8, max_tokens=100000)(messages) == messages
+
+
+def test_reserved_tokens_count_against_the_budget():
+    messages = make_history(4)
+    history_tokens = sum(message_tokens(message) for message in messages)
+
+    assert len(HistoryWindow("judge_agent", keep_last=8, max_tokens=history_tokens + 100)(messages)) == 5
+    reserved = 2 * message_tokens(messages[1])
+    windowed = HistoryWindow("judge_agent", keep_last=8, max_tokens=history_tokens + 100, reserved=reserved)(messages)
+    assert sum(message_tokens(message) for message in windowed) < history_tokens + 100 - reserved
+    assert windowed[1]["content"].startswith("Summary of the earlier proceedings:")
+    assert windowed[-1] == messages[-1]
+
+
+def test_turns_dropped_for_the_budget_are_summarized():
+    messages = make_history(4)
+    window = HistoryWindow("judge_agent", keep_last=8, max_tokens=3 * message_tokens(messages[1]))
+    windowed = window(messages)
+
+    assert windowed[0]["content"] == messages[0]["content"]
+    summary = windowed[1]["content"]
+    assert summary.startswith("Summary of the earlier proceedings:")
+    assert "agent_1: Turn 1 answer." in summary
+    assert windowed[-1] == messages[-1]
+
+    # The next call keeps them summarized instead of summarizing them again
+    messages.append({"role": "user", "name": "agent_5", "content": "Turn 5 answer."})
+    summary = window(messages)[1]["content"]
+    assert summary.count("agent_1:") == 1
+
+
+def test_call_with_excerpts_stays_within_the_budget_on_a_summary_request():
+    from autogen import ConversableAgent
+
+    from history import attach_history_window, count_tokens
+    from retrieval import DocumentIndex, attach_retrieval
+
+    index = DocumentIndex(" ".join(f"Exhibit {i} shows the receipt, the car and the parking lot." for i in range(400)))
+    messages = make_history(12, words=60)
+    messages.append({"role": "user", "name": "human_proxy", "content": "Can you summarize your testimony?"})
+
+    for max_tokens in (1100, 1500, 3000):
+        agent = ConversableAgent(name="witness_agent", system_message="You are the witness.", llm_config=False)
+        attach_history_window([agent], keep_last=8, max_tokens=max_tokens, reserved=index.excerpt_tokens())
+        attach_retrieval([agent], index)
+        prompt = agent.process_all_messages_before_reply(messages)
+
+        assert prompt[-2]["content"].startswith("<case_excerpts>")
+        total = count_tokens(agent.system_message) + 4 + sum(message_tokens(message) for message in prompt)
+        assert total <= max_tokens
@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+import llm_client
+from llm_client import LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, CallLimiter, SharedHttpClient, _backoff, llm_session
+
+URL = "http://llm.test/v1/chat/completions"
+
+
+def completion_request(model="gpt-4o-mini"):
+    return httpx.Request("POST", URL, content=json.dumps({"model": model}).encode())
+
+
+# A client whose provider answers with `responses` in turn (a response, or an exception to raise),
+# counting against a limiter of its own; returns the client, the limiter and the backoff delays slept
+def make_client(monkeypatch, *responses, **limits):
+    answers = iter(responses)
+
+    def handler(request):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    limiter = CallLimiter(**limits)
+    delays = []
+    monkeypatch.setattr(llm_client, "llm_limiter", limiter)
+    monkeypatch.setattr(llm_client.time, "sleep", delays.append)
+    return SharedHttpClient(transport=httpx.MockTransport(handler)), limiter, delays
+
+
+def test_calls_beyond_the_cap_wait_then_time_out():
+    limiter = CallLimiter(max_in_flight=2, session_max_in_flight=2, timeout=0.05)
+    releases = [limiter.acquire("m", None, None) for _ in range(2)]
+
+    with pytest.raises(httpx.PoolTimeout):
+        limiter.acquire("m", None, None)
+    assert limiter.get_stats()["timeouts"] == 1
+
+    # A call waiting for a slot gets the one released
+    waiting = threading.Thread(target=lambda: releases.append(limiter.acquire("m", None, None)))
+    waiting.start()
+    while limiter.get_stats()["waiting"] != {"m": 1}:
+        time.sleep(0.001)
+    time.sleep(0.02)
+    releases.pop(0)()
+    waiting.join()
+    assert limiter.get_stats()["in_flight"] == {"m": 2}
+    assert limiter.get_stats()["queued"] == 1
+
+
+def test_one_session_cannot_take_every_slot():
+    limiter = CallLimiter(max_in_flight=4, session_max_in_flight=1, timeout=0.05)
+    release = limiter.acquire("m", "busy", None)
+
+    with pytest.raises(httpx.PoolTimeout):
+        limiter.acquire("m", "busy", None)
+    limiter.acquire("m", "other", None)()
+    release()
+    assert limiter.get_stats() == {
+        "calls": 2, "queued": 0, "timeouts": 1, "retries": 0, "waiting": {}, "in_flight": {}, "sessions": 0
+    }
+
+
+def test_streamed_response_holds_its_slot_until_closed(monkeypatch):
+    client, limiter, _ = make_client(monkeypatch, httpx.Response(200, content=iter([b"data: {}\n\n"])))
+
+    with llm_session("session"):
+        response = client.send(completion_request(), stream=True)
+    assert limiter.get_stats()["in_flight"] == {"gpt-4o-mini": 1}
+    assert response.read() == b"data: {}\n\n"
+    response.close()
+    assert limiter.get_stats()["in_flight"] == {}
+    assert limiter.get_stats()["sessions"] == 0
+
+
+def test_failed_call_releases_its_slot(monkeypatch):
+    client, limiter, delays = make_client(monkeypatch, httpx.ReadTimeout("too slow"))
+
+    with pytest.raises(httpx.ReadTimeout):
+        client.send(completion_request())
+    assert limiter.get_stats()["in_flight"] == {}
+    assert delays == []
+
+
+def test_rate_limited_call_waits_for_retry_after(monkeypatch):
+    client, limiter, delays = make_client(
+        monkeypatch,
+        httpx.Response(429, headers={"Retry-After": "2"}),
+        httpx.Response(503, headers={"Retry-After": "3600"}),
+        httpx.ConnectError("refused"),
+        httpx.Response(200, json={"choices": []}),
+    )
+
+    response = client.send(completion_request())
+    assert response.status_code == 200
+    # The provider's delay, capped, then jittered backoff for the failed connection
+    assert delays[:2] == [2.0, LLM_BACKOFF_MAX]
+    assert 0 <= delays[2] <= min(LLM_BACKOFF_BASE * 4, LLM_BACKOFF_MAX)
+    assert limiter.get_stats()["retries"] == 3
+    assert limiter.get_stats()["in_flight"] == {}
+
+
+def test_backoff_without_retry_after_is_jittered():
+    delays = [_backoff(3) for _ in range(50)]
+    assert all(0 <= delay <= min(LLM_BACKOFF_BASE * 8, LLM_BACKOFF_MAX) for delay in delays)
+    assert len(set(delays)) > 1
+    assert _backoff(0, httpx.Response(429, headers={"Retry-After": "soon"})) <= LLM_BACKOFF_BASE
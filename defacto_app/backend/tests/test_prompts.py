@@ -0,0 +1,38 @@
+from autogen import ConversableAgent
+
+from prompts import attach_prompt_layout
+from retrieval import attach_retrieval
+
+
+class StubIndex:
+    def search(self, query, k):
+        return ["The car was parked outside the store."]
+
+
+def make_agent():
+    agent = ConversableAgent(name="judge_agent", system_message="You are the judge.", llm_config=False)
+    attach_retrieval([agent], StubIndex())
+    attach_prompt_layout([agent], opening=True)
+    return agent
+
+
+def test_excerpts_follow_the_opening_on_the_first_turn():
+    opening = {"role": "user", "name": "human_proxy", "content": "Opening message"}
+    prompt = make_agent().process_all_messages_before_reply([opening])
+    assert prompt[0] == opening
+    assert prompt[1] == {"role": "system", "content": "You are the judge."}
+    assert prompt[2]["content"].startswith("<case_excerpts>")
+
+
+def test_excerpts_stay_before_the_last_message():
+    messages = [
+        {"role": "user", "name": "human_proxy", "content": "Opening message"},
+        {"role": "user", "name": "defense_attorney", "content": "Where were you?"},
+        {"role": "user", "name": "defendant_agent", "content": "At home."},
+    ]
+    prompt = make_agent().process_all_messages_before_reply(messages)
+    assert prompt[0] == messages[0]
+    assert prompt[1]["content"] == "You are the judge."
+    assert prompt[2] == messages[1]
+    assert prompt[3]["content"].startswith("<case_excerpts>")
+    assert prompt[4] == messages[2]
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from request_queue import SessionBusyError, SessionRequestQueue
+
+
+def test_requests_of_a_session_run_in_order_and_identical_ones_share_a_run():
+    queue = SessionRequestQueue(depth=4)
+    runs = []
+
+    def work(name):
+        async def run():
+            runs.append(name)
+            await asyncio.sleep(0.01)
+            return name
+
+        return run
+
+    async def scenario():
+        first, _ = queue.submit("session", ("continue", "Q1"), work("Q1"))
+        second, _ = queue.submit("session", ("continue", "Q2"), work("Q2"))
+        # Same endpoint and message: follows the waiting run; another message runs on its own
+        again, shared = queue.submit("session", ("continue", "Q2"), work("Q2 again"), "events")
+        feedback, _ = queue.submit("session", ("feedback", "Q2"), work("feedback"))
+        other, _ = queue.submit("other", ("continue", "Q2"), work("other"))
+        return await asyncio.gather(first, second, again, feedback, other), again is second, shared
+
+    results, coalesced, shared = asyncio.run(scenario())
+    assert results == ["Q1", "Q2", "Q2", "feedback", "other"]
+    assert coalesced and shared is None
+    assert runs.index("Q1") < runs.index("Q2") < runs.index("feedback")
+    assert queue.get_stats() == {"runs": 4, "coalesced": 1, "queued": 2, "rejected": 0, "active_sessions": 0}
+
+
+@pytest.mark.parametrize("depth, status_code", [(0, 409), (2, 429)])
+def test_requests_beyond_the_queue_depth_are_turned_away(depth, status_code):
+    queue = SessionRequestQueue(depth=depth)
+
+    async def scenario():
+        release = asyncio.Event()
+        tasks = [queue.submit("session", ("continue", i), release.wait)[0] for i in range(depth + 1)]
+        with pytest.raises(SessionBusyError) as busy:
+            queue.submit("session", ("continue", "one too many"), release.wait)
+        release.set()
+        await asyncio.gather(*tasks)
+        # Room again once the session's requests are done
+        await queue.submit("session", ("continue", "later"), release.wait)[0]
+        return busy.value
+
+    busy = asyncio.run(scenario())
+    assert busy.status_code == status_code
+    assert queue.stats["rejected"] == 1
+
+
+def test_shared_run_survives_a_caller_that_disconnects():
+    import app
+
+    runs = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        runs.append("done")
+        return {"response": "answer"}
+
+    async def scenario():
+        key = ("simulation_continue", "Q")
+        leaving = asyncio.create_task(app.run_in_session("queue-test", key, work))
+        staying = asyncio.create_task(app.run_in_session("queue-test", key, work))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying, leaving.cancelled()
+
+    assert asyncio.run(scenario()) == ({"response": "answer"}, True)
+    assert runs == ["done"]
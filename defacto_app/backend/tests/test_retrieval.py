@@ -0,0 +1,53 @@
+from retrieval import TOP_K, DocumentIndex, attach_retrieval, chunk_text
+
+
+# A document of `sections` chunk-sized sections, each about its own exhibit
+def make_document(sections=12):
+    return " ".join(
+        f"Section {i}. Exhibit {i} is a " + " ".join([f"item{i}"] * 150) + "." for i in range(sections)
+    )
+
+
+def test_search_returns_the_top_k_matching_passages_in_document_order():
+    index = DocumentIndex(make_document() + " The pawn shop receipt for the stolen watch is dated June 3.")
+
+    # Only passages sharing a term with the query
+    assert index.search("When was the watch sold to the pawn shop?") == [index.chunks[-1]]
+    # At most k of them, the best scoring
+    assert len(index.search("Which exhibit?")) == TOP_K
+
+    excerpts = index.search("Show me item3 and item7", k=2)
+    assert len(excerpts) == 2
+    assert "item3" in excerpts[0] and "item7" in excerpts[1]
+
+
+def test_summary_request_spreads_k_passages_over_the_document():
+    index = DocumentIndex(make_document())
+
+    excerpts = index.search("Can you summarize the case?", k=3)
+    assert len(excerpts) == 3
+    assert excerpts[0] == index.chunks[0]
+    assert [index.chunks.index(excerpt) for excerpt in excerpts] == sorted(
+        index.chunks.index(excerpt) for excerpt in excerpts
+    )
+    assert index.chunks.index(excerpts[-1]) >= len(index.chunks) // 2
+
+
+def test_excerpts_are_added_to_the_prompt_only():
+    from autogen import ConversableAgent
+
+    agent = ConversableAgent(name="witness_agent", system_message="You are the witness.", llm_config=False)
+    attach_retrieval([agent], DocumentIndex(make_document()), k=1)
+    messages = [{"role": "user", "name": "human_proxy", "content": "What is item5?"}]
+
+    prompt = agent.process_all_messages_before_reply(messages)
+    assert prompt[0]["content"].startswith("<case_excerpts>\n")
+    assert "item5" in prompt[0]["content"]
+    assert prompt[1:] == messages
+    assert len(messages) == 1
+
+
+def test_chunks_overlap():
+    chunks = chunk_text(" ".join(str(i) for i in range(300)), chunk_words=100, overlap=20)
+    assert [chunk.split()[0] for chunk in chunks] == ["0", "80", "160", "240"]
+    assert chunks[1].split()[:20] == chunks[0].split()[-20:]
@@ -0,0 +1,113 @@
+import pytest
+
+from session_store import MemorySnapshotBackend, SessionStore, SnapshotConflictError, SQLiteSnapshotBackend
+
+
+def make_store(max_memory_bytes=1024 * 1024):
+    return SessionStore(
+        MemorySnapshotBackend(),
+        snapshot=lambda session: dict(session),
+        restore=lambda snapshot: dict(snapshot),
+        max_memory_bytes=max_memory_bytes,
+    )
+
+
+def test_document_goes_with_its_last_snapshot():
+    backend = MemorySnapshotBackend()
+    backend.put_document("doc", "case text")
+    backend.save("a", {"document": "doc"})
+    backend.save("b", {"document": "doc"})
+    backend.save("a", {"document": "doc"})
+
+    backend.delete("a")
+    assert backend.get_document("doc") == "case text"
+    backend.delete("b")
+    assert backend.get_document("doc") is None
+    assert backend.resident_bytes() == 0
+
+
+def test_expire_drops_old_snapshots_and_unused_documents():
+    backend = MemorySnapshotBackend()
+    backend.put_document("used", "case text")
+    backend.put_document("unused", "other case")
+    backend.save("a", {"document": "used"})
+
+    backend.expire(-1)
+    assert backend.load("a") == (None, 0)
+    assert backend.get_document("used") is None
+    assert backend.get_document("unused") is None
+    assert backend.resident_bytes() == 0
+
+
+def test_sqlite_expire_drops_documents_no_session_refers_to(tmp_path):
+    backend = SQLiteSnapshotBackend(str(tmp_path / "sessions.sqlite3"))
+    backend.put_document("shared", "case text")
+    backend.put_document("old", "other case")
+    backend.save("old", {"document": "old"})
+    backend.save("kept", {"document": "shared"})
+    backend.save("expired", {"document": "shared"})
+    backend._conn.execute("UPDATE sessions SET updated_at = 0 WHERE id IN ('old', 'expired')")
+    backend._conn.execute("UPDATE documents SET added_at = 0")
+
+    backend.expire(3600)
+    assert backend.load("old") == (None, 0)
+    assert backend.get_document("old") is None
+    assert backend.get_document("shared") == "case text"
+
+    # A new upload is kept until sessions are saved with it
+    backend.put_document("new", "new case")
+    backend.expire(3600)
+    assert backend.get_document("new") == "new case"
+
+    backend.expire(-1)
+    assert backend.get_document("shared") is None
+    assert backend.get_document("new") is None
+
+
+def test_snapshots_count_against_the_memory_budget():
+    padding = "x" * 1000
+    store = make_store(max_memory_bytes=2500)
+    for session_id in ["a", "b", "c"]:
+        store.save(session_id, {"document": None, "padding": padding})
+
+    # Only the oldest session that is no longer live is dropped
+    assert store.get("a") is None
+    assert store.get("b") is not None
+    assert store.get("c") is not None
+    assert store.get_stats()["snapshot_evictions"] == 1
+
+
+def test_session_in_use_is_not_evicted():
+    store = make_store(max_memory_bytes=0)
+    session = {"document": None, "turn": 1}
+    store.save("a", session)
+    with store.in_use("a"):
+        store.save("b", {"document": None})
+        session["turn"] = 2
+        store.save("a", session)
+        store.save("c", {"document": None})
+        assert store.get("a") is session
+
+
+def test_save_over_a_snapshot_saved_by_another_worker_conflicts(tmp_path):
+    backend = SQLiteSnapshotBackend(str(tmp_path / "sessions.sqlite3"))
+    worker, other = (
+        SessionStore(backend, snapshot=lambda session: dict(session), restore=lambda snapshot: dict(snapshot))
+        for _ in range(2)
+    )
+    worker.save("a", {"document": None, "turn": 1})
+    mine, theirs = worker.get("a"), other.get("a")
+
+    theirs["turn"] = 2
+    other.save("a", theirs)
+    mine["turn"] = 3
+    with pytest.raises(SnapshotConflictError):
+        worker.save("a", mine)
+    assert worker.get_stats()["conflicts"] == 1
+
+    # The next access gets the other worker's session, which saves normally
+    session = worker.get("a")
+    assert session["turn"] == 2
+    session["turn"] = 3
+    worker.save("a", session)
+    assert backend.load("a") == ({"document": None, "turn": 3}, 3)
@@ -0,0 +1,113 @@
+from autogen import ConversableAgent, GroupChat
+
+from methods import AGENT_TEMPLATES, define_transitions
+from speaker_selection import NAME_PATTERN, CourtroomSpeakerSelector
+
+
+def make_trial(user_role="DA", extra_disallowed=None):
+    agents = {
+        key: ConversableAgent(name=template["name"], llm_config=False)
+        for key, template in AGENT_TEMPLATES[user_role].items()
+    }
+    disallowed = define_transitions(agents, user_role)
+    for speaker, targets in (extra_disallowed or {}).items():
+        disallowed[agents[speaker]] = disallowed.get(agents[speaker], []) + [agents[key] for key in targets]
+    groupchat = GroupChat(
+        agents=list(agents.values()),
+        messages=[],
+        allowed_or_disallowed_speaker_transitions=disallowed,
+        speaker_transitions_type="disallowed",
+    )
+    groupchat.append({"content": "Opening message", "role": "user"}, agents["human_proxy"])
+    return agents, groupchat, CourtroomSpeakerSelector(agents, user_role)
+
+
+def say(groupchat, agent, content):
+    groupchat.append({"content": content, "role": "user"}, agent)
+    return agent
+
+
+def test_opening_message_is_left_to_the_llm():
+    agents, groupchat, select = make_trial()
+    assert select(agents["human_proxy"], groupchat) == "auto"
+
+
+def test_question_goes_to_the_testifier_on_the_stand():
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["human_proxy"], "Where were you on the night of March 3rd?")
+    # The trial opens with the defendant on the stand
+    assert select(last, groupchat) is agents["defendant_agent"]
+
+
+def test_answer_back_to_the_user_ends_the_round():
+    agents, groupchat, select = make_trial()
+    say(groupchat, agents["human_proxy"], "Where were you on the night of March 3rd?")
+    last = say(groupchat, agents["defendant_agent"], "I was at home.")
+    assert select(last, groupchat) is None
+
+
+def test_answer_goes_back_to_the_opponent_examining():
+    agents, groupchat, select = make_trial()
+    say(groupchat, agents["prosecuting_attorney"], "Isn't it true you were at the store?")
+    last = say(groupchat, agents["defendant_agent"], "No.")
+    assert select(last, groupchat) is agents["prosecuting_attorney"]
+
+
+def test_finished_and_objections_go_to_the_judge():
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["human_proxy"], "No further questions, Your Honor.")
+    assert select(last, groupchat) is agents["judge_agent"]
+
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["prosecuting_attorney"], "Objection, leading the witness.")
+    assert select(last, groupchat) is agents["judge_agent"]
+
+
+def test_judge_gives_the_floor_to_the_attorney_named():
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["judge_agent"], "The prosecution may cross-examine.")
+    assert select(last, groupchat) is agents["prosecuting_attorney"]
+
+    agents, groupchat, select = make_trial("PA")
+    last = say(groupchat, agents["judge_agent"], "The defense may begin its cross-examination.")
+    assert select(last, groupchat) is agents["defense_attorney"]
+
+
+def test_judge_naming_both_sides_is_left_to_the_llm():
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["judge_agent"], "The prosecution and the defense will approach the bench.")
+    assert select(last, groupchat) == "auto"
+
+
+def test_statement_without_a_question_is_left_to_the_llm():
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["prosecuting_attorney"], "Let the record reflect the exhibit.")
+    assert select(last, groupchat) == "auto"
+
+
+def test_testifier_is_addressed_by_the_name_they_gave():
+    agents, groupchat, select = make_trial()
+    say(groupchat, agents["human_proxy"], "Please state your name for the record?")
+    say(groupchat, agents["witness_agent"], "My name is Jane Smith.")
+    say(groupchat, agents["human_proxy"], "Thank you?")
+    say(groupchat, agents["defendant_agent"], "I was at home.")
+    last = say(groupchat, agents["human_proxy"], "Ms. Smith, what did you see that night?")
+    assert select(last, groupchat) is agents["witness_agent"]
+
+
+def test_call_names_the_testifier():
+    agents, groupchat, select = make_trial()
+    last = say(groupchat, agents["human_proxy"], "The defense calls the witness.")
+    assert select(last, groupchat) is agents["witness_agent"]
+
+
+def test_disallowed_transition_is_left_to_the_llm():
+    agents, groupchat, select = make_trial(extra_disallowed={"judge_agent": ["defendant_agent"]})
+    last = say(groupchat, agents["judge_agent"], "The defendant will answer.")
+    assert select(last, groupchat) == "auto"
+
+
+def test_name_pattern_lead_in_ignores_case_but_the_name_does_not():
+    assert [name.strip(" .") for name in NAME_PATTERN.findall("My name is Jane Smith.")] == ["Jane Smith"]
+    assert [name.strip(" .") for name in NAME_PATTERN.findall("I'm Officer Brown, sir.")] == ["Officer Brown"]
+    assert NAME_PATTERN.findall("I am not sure what happened.") == []
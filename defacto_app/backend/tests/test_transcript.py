@@ -0,0 +1,30 @@
+from transcript import Transcript
+
+
+def make_transcript(count):
+    return Transcript([{"seq": seq, "content": f"m{seq}", "role": "user", "name": None} for seq in range(1, count + 1)])
+
+
+def test_page_starts_after_the_cursor():
+    page, _ = make_transcript(5).page(2, limit=2)
+    assert [message["seq"] for message in page["messages"]] == [3, 4]
+    assert page["cursor"] == 4
+    assert page["has_more"]
+
+
+def test_etag_changes_when_more_messages_follow():
+    transcript = make_transcript(3)
+    page, etag = transcript.page(1, limit=10)
+    assert not page["has_more"]
+
+    transcript.append({"content": "m4", "role": "user", "name": None})
+    page, newer_etag = transcript.page(1, limit=2)
+    assert [message["seq"] for message in page["messages"]] == [2, 3]
+    assert page["has_more"]
+    assert newer_etag != etag
+
+
+def test_page_past_the_end_is_empty():
+    page, etag = make_transcript(2).page(7)
+    assert page == {"messages": [], "cursor": 2, "has_more": False}
+    assert etag == '"7-2"'
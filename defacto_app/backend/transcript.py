@@ -0,0 +1,58 @@
+import os
+
+from methods import display_name
+
+
+# Messages per page of GET .../transcript/{session_id}
+TRANSCRIPT_PAGE_SIZE = int(os.getenv("DEFACTO_TRANSCRIPT_PAGE_SIZE", "50"))
+TRANSCRIPT_MAX_PAGE_SIZE = 500
+
+
+# Append-only log of the messages of a conversation as the user sees them. Every message gets a sequence
+# number (from 1) and its display name when it is appended; entries never change afterwards, so clients
+# can ask for what follows the last sequence number they have (their cursor).
+class Transcript:
+    def __init__(self, messages=()):
+        self.messages = list(messages)
+
+    @property
+    def cursor(self):
+        return len(self.messages)
+
+    def append(self, message):
+        entry = {
+            "seq": len(self.messages) + 1,
+            "content": message.get("content"),
+            "role": message.get("role"),
+            "name": display_name(message.get("name")),
+        }
+        self.messages.append(entry)
+        return entry
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    # Utility to catch up with a message list the transcript mirrors one to one, e.g. a group chat's
+    # messages; only the messages past the transcript's end are looked at
+    def sync(self, messages):
+        self.extend(messages[len(self.messages):])
+
+    # Messages after `cursor`, at most `limit` of them
+    def since(self, cursor, limit=None):
+        start = min(max(cursor, 0), len(self.messages))
+        end = len(self.messages) if limit is None else min(start + limit, len(self.messages))
+        return self.messages[start:end]
+
+    # Utility to serve one page of the transcript; returns (page, etag). Appended entries never
+    # change, so a page is identified by where it starts and ends, and whether more follow.
+    def page(self, cursor, limit=TRANSCRIPT_PAGE_SIZE):
+        messages = self.since(cursor, min(max(limit, 1), TRANSCRIPT_MAX_PAGE_SIZE))
+        end = messages[-1]["seq"] if messages else max(min(cursor, len(self.messages)), 0)
+        page = {
+            "messages": messages,
+            "cursor": end,
+            "has_more": end < len(self.messages),
+        }
+        more = "+" if page["has_more"] else ""
+        return page, f'"{max(cursor, 0)}-{end}{more}"'